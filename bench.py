@@ -0,0 +1,178 @@
+#!/bin/python
+
+# Times the expensive parts of a game turn on seeded maps of several sizes and monster
+# densities, and writes the results as JSON so runs from different commits can be compared.
+#
+#   python bench.py --out bench.json
+#   python bench.py --sizes 60x30,200x100 --densities 3 --repeat 20
+#   python bench.py --render   (opens the game window to time rendering as well)
+
+import libtcodpy as libtcod
+import pyRL
+import paths
+from fov import WindowedFov, ShadowcastFov, WINDOW_ALGOS
+from lighting import Light
+from geometry import Pos
+import argparse
+import json
+import os
+import subprocess
+import time
+
+SIZES = [(60, 30), (200, 100), (500, 500), (1000, 1000)]
+DENSITIES = [0, 3, 10]  #maximum monsters per room
+MAX_ROOMS_CAP = 1000
+BOUNDED_DISTANCE = 30  #cutoff for the path_bounded queries
+FOV_ALGORITHMS = [('basic', libtcod.FOV_BASIC), ('diamond', libtcod.FOV_DIAMOND), ('shadow', libtcod.FOV_SHADOW),
+                  ('permissive', libtcod.FOV_PERMISSIVE_4), ('restrictive', libtcod.FOV_RESTRICTIVE)]
+
+def timed(function, repeat=1):
+    #seconds per call of function, averaged over repeat calls
+    start = time.time()
+    for i in range(repeat):
+        function()
+    return (time.time() - start) / repeat
+
+def commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def floor_cells(m, rng, count):
+    #count random passable positions of the map
+    floor = [i for i in range(m.w * m.h) if not m.blocked[i]]
+    return [Pos(floor[j] % m.w, floor[j] / m.w)
+            for j in [libtcod.random_get_int(rng, 0, len(floor) - 1) for k in range(count)]]
+
+def bench_game(w, h, density, seed, repeat, turns, render=False):
+    #the timings, in seconds per operation, for one map size and monster density.
+    #render_map is only timed with render, which needs the window open (see run)
+    results = {}
+    max_rooms = min(MAX_ROOMS_CAP, pyRL.MAX_ROOMS * w * h / (pyRL.MAP_WIDTH * pyRL.MAP_HEIGHT))
+    results['new_game'] = timed(lambda: pyRL.new_game(seed, w, h, max_rooms, density))
+    m = pyRL.map
+    rng = libtcod.random_new_from_seed(seed)
+
+    def generate():
+        m.set_objects([pyRL.npc, pyRL.player])
+        m.generate_map(max_rooms, density)
+        pyRL.schedule_monsters()
+    results['generate_map'] = timed(generate)
+    pyRL.fov_recompute = True
+    pyRL.update_fov()
+
+    def fov():
+        pyRL.fov_recompute = True
+        pyRL.update_fov()
+    results['fov'] = timed(fov, repeat)
+    if render:
+        results['render_map'] = timed(pyRL.render_map, repeat)
+
+    #the player's FOV from random cells: libtcod on the whole map, then libtcod and the
+    #shadowcasting tables on the same window around the viewer, with the same output
+    views = [(p.x, p.y) for p in floor_cells(m, rng, repeat)]
+    m.sync_fov(pyRL.fov_map, pyRL.fov_changes)
+    for (name, algo) in FOV_ALGORITHMS:
+        viewers = iter(views)
+        def fov_libtcod():
+            x, y = next(viewers)
+            libtcod.map_compute_fov(pyRL.fov_map, x, y, pyRL.TORCH_RADIUS, pyRL.FOV_LIGHT_WALLS, algo)
+        results['fov_libtcod_' + name] = timed(fov_libtcod, repeat)
+    engines = [('window_' + name, WindowedFov, algo) for (name, algo) in FOV_ALGORITHMS if algo in WINDOW_ALGOS]
+    for (name, engine, algo) in engines + [('tables', ShadowcastFov, 0)]:
+        viewer_fov = engine(m, pyRL.TORCH_RADIUS, pyRL.FOV_LIGHT_WALLS, algo)
+        viewers = iter(views)
+        results['fov_' + name] = timed(lambda: viewer_fov.lit_from(*next(viewers)), repeat)
+        viewer_fov.close()
+    #below 1 when the tables are slower than libtcod's shadowcasting on the same window
+    results['fov_tables_speedup'] = results['fov_window_shadow'] / max(results['fov_tables'], 1e-9)
+    #moving one light around among the others: only it gets re-lit
+    if pyRL.lighting is not None:
+        light = pyRL.lighting.add(Light(0, 0, pyRL.TORCH_RADIUS, pyRL.TORCH_COLOR))
+        viewers = iter(views)
+        def relight():
+            light.x, light.y = next(viewers)
+            pyRL.lighting.update()
+        results['lighting'] = timed(relight, repeat)
+        pyRL.lighting.remove(light)
+
+    cells = floor_cells(m, rng, 1000)
+    results['is_blocked'] = timed(lambda: [pyRL.is_blocked(p.x, p.y, m) for p in cells]) / len(cells)
+
+    ends = floor_cells(m, rng, 2 * repeat)
+    pairs = iter(zip(ends[0::2], ends[1::2]))
+    def path():
+        start, goal = next(pairs)
+        paths.towards(m, start, goal, consider_unexplored_blocked=False)
+    results['path'] = timed(path, repeat)
+
+    pairs = iter(zip(ends[0::2], ends[1::2]))
+    results['path_cached'] = timed(path, repeat)  #the same queries again, answered by m.path_cache
+
+    #the two engines for static costs on the same queries, without the cache or the room graph
+    paths._load_static_costs(m, m.path_finder, False)
+    for engine in (paths.ASTAR, paths.JPS):
+        m.path_finder.engine = engine
+        pairs = iter(zip(ends[0::2], ends[1::2]))
+        results['path_' + engine] = timed(lambda: m.path_finder.compute_path(*next(pairs), native=True), repeat)
+    m.path_finder.engine = paths.ASTAR
+
+    m.path_cache.clear()
+    pairs = iter(zip(ends[0::2], ends[1::2]))
+    def path_bounded():
+        start, goal = next(pairs)
+        paths.towards(m, start, goal, consider_unexplored_blocked=False, max_distance=BOUNDED_DISTANCE)
+    results['path_bounded'] = timed(path_bounded, repeat)
+
+    batch = [(start, goal, {'consider_unexplored_blocked': False})
+             for (start, goal) in zip(ends[0::2], ends[1::2])]
+    m.path_cache.clear()
+    results['path_batch'] = timed(lambda: paths.towards_many(m, batch)) / len(batch)
+
+    pairs = iter(zip(ends[0::2], ends[1::2]))
+    def path_callback():
+        start, goal = next(pairs)
+        paths.towards(m, start, goal, consider_unexplored_blocked=False, avoid_solid_objects=True)
+    results['path_callback'] = timed(path_callback, repeat)
+
+    def ai_turns():
+        for i in range(turns):
+            pyRL.take_monster_turns()
+    results['ai_turn'] = timed(ai_turns) / turns
+    return results
+
+def run(sizes=SIZES, densities=DENSITIES, seed=1, repeat=10, turns=100, render=False):
+    #libtcod's console drawing calls crash until the font and root console are set up,
+    #so rendering is only timed with render, which opens the game window first
+    if render:
+        pyRL.init_window()
+    records = []
+    for (w, h) in sizes:
+        for density in densities:
+            results = bench_game(w, h, density, seed, repeat, turns, render)
+            records.append({'width': w, 'height': h, 'density': density, 'seed': seed,
+                            'monsters': len([o for o in pyRL.map.objects if o.ai]),
+                            'results': results})
+    return {'commit': commit(), 'time': time.time(), 'repeat': repeat, 'turns': turns, 'runs': records}
+
+def parse_sizes(text):
+    return [tuple(int(n) for n in size.split('x')) for size in text.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pyRL game loop.')
+    parser.add_argument('--sizes', type=parse_sizes, default=SIZES, help='eg. 60x30,500x500')
+    parser.add_argument('--densities', type=lambda t: [int(n) for n in t.split(',')], default=DENSITIES)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--turns', type=int, default=100)
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--render', action='store_true', help='open the game window and time render_map too')
+    args = parser.parse_args()
+    report = run(args.sizes, args.densities, args.seed, args.repeat, args.turns, args.render)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for record in report['runs']:
+        print '%(width)dx%(height)d density %(density)d (%(monsters)d monsters):' % record, ', '.join(
+            '%s %.6f' % (name, value) for (name, value) in sorted(record['results'].items()))
@@ -0,0 +1,73 @@
+import heapq
+from geometry import Pos
+from distmap import NEIGHBOURS
+
+# Bidirectional search with a distance cutoff, over a cost plane (see paths.CostPlanes).
+# One search grows from the start and one from the goal, each time on the side whose
+# frontier is closer, and they stop as soon as the best route through their meeting cells
+# is proven, so each only covers about half the distance. A route longer than max_distance
+# is never looked for: an unreachable or far away goal costs a search of a disc of radius
+# max_distance / 2 around both ends, not of the whole map.
+
+DIAGONAL_COST = 1.41
+
+def _octile(dx, dy):
+    dx, dy = abs(dx), abs(dy)
+    return max(dx, dy) + (DIAGONAL_COST - 1) * min(dx, dy)
+
+def find_path(costs, w, h, start, goal, goal_cost, max_distance):
+    #the cells from start (excluded) to goal as Pos, or [] if no route costs max_distance
+    #or less. costs[i] is what stepping onto cell i costs (0 if it can't be), goal_cost
+    #stands in for the goal's own cost; diagonal steps cost DIAGONAL_COST times more.
+    s, g = start.y * w + start.x, goal.y * w + goal.x
+    if s == g or not goal_cost or _octile(goal.x - start.x, goal.y - start.y) > max_distance:
+        return []
+
+    def cost(i):
+        return goal_cost if i == g else costs[i]
+
+    #forward distances are from the start, backward ones to the goal; side 0 is forward
+    distances = ({s: 0}, {g: 0})
+    parents = ({s: None}, {g: None})
+    queues = ([(0, s)], [(0, g)])
+    best, meeting = max_distance + 1e-9, None
+    while queues[0] and queues[1]:
+        if queues[0][0][0] + queues[1][0][0] >= best:
+            break
+        side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+        distance, i = heapq.heappop(queues[side])
+        if distance > distances[side][i]:
+            continue
+        mine, theirs = distances[side], distances[1 - side]
+        x, y = i % w, i / w
+        for (dx, dy) in NEIGHBOURS:
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < w and 0 <= ny < h):
+                continue
+            j = ny * w + nx
+            #going forward, the cell stepped onto is j; going backward it is i, and j
+            #is only a dead end unless it can be stepped onto too (or is the start)
+            step = cost(j) if side == 0 else cost(i)
+            if not step or (side == 1 and j != s and not cost(j)):
+                continue
+            new_distance = distance + step * (DIAGONAL_COST if dx and dy else 1)
+            if new_distance < mine.get(j, best):
+                mine[j] = new_distance
+                parents[side][j] = i
+                heapq.heappush(queues[side], (new_distance, j))
+                if j in theirs and new_distance + theirs[j] < best:
+                    best, meeting = new_distance + theirs[j], j
+    if meeting is None:
+        return []
+
+    cells = []
+    i = meeting
+    while i != s:
+        cells.append(i)
+        i = parents[0][i]
+    cells.reverse()
+    i = parents[1][meeting]
+    while i is not None:
+        cells.append(i)
+        i = parents[1][i]
+    return [Pos(i % w, i / w) for i in cells]
@@ -0,0 +1,178 @@
+import libtcodpy as libtcod
+import planes
+from planes import numpy_available
+import heapq
+
+if numpy_available:
+    import numpy
+
+UNREACHABLE = libtcod.DIJKSTRA_UNREACHABLE
+NEIGHBOURS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+FAR = 2 ** 31 - 1  #unreachable, in the signed planes of relax()
+STRAIGHT, DIAGONAL = 100, 141  #step costs, in hundredths like the libtcod distances
+FLEE_SCALE = -1.2  #how a chase map is turned into a flee map, see FleeMap
+FLEE_RADIUS = 20  #a flee map only covers the cells this close to what is fled from
+SOURCE_RANGE = 40 * STRAIGHT  #a source map only reaches this far from its sources
+
+def downhill(distances, w, h, x, y, is_blocked=None):
+    #the step (dx, dy) to the neighbouring cell closest to the root of a distances plane that
+    #is not blocked (is_blocked(x, y) can rule out eg. cells taken by monsters), or None if no
+    #step gets closer
+    best, step = distances[y * w + x], None
+    for (dx, dy) in NEIGHBOURS:
+        nx, ny = x + dx, y + dy
+        if 0 <= nx < w and 0 <= ny < h:
+            distance = distances[ny * w + nx]
+            if distance < best and (is_blocked is None or not is_blocked(nx, ny)):
+                best, step = distance, (dx, dy)
+    return step
+
+class DistanceMap:
+    #the walking distance from every cell of a map to one root cell, in hundredths of a step.
+    #It is filled by one native flood fill over a libtcod map's walkable flags and copied
+    #out with one call, so any number of monsters can then chase the root by walking downhill.
+    def __init__(self, walk_map, w, h, diagonal_cost=1.41):
+        self.w = w
+        self.h = h
+        self.dijkstra = libtcod.dijkstra_new(walk_map, diagonal_cost)
+        self.distances = planes.new_plane(w * h, UNREACHABLE, 'I')
+        self.root = None
+        self.revision = None
+
+    def compute(self, x, y, revision=None):
+        #revision is whatever the caller uses to tell when the map changed, see TileMap.revision
+        libtcod.dijkstra_compute(self.dijkstra, x, y)
+        libtcod.dijkstra_get_distances(self.dijkstra, self.distances)
+        self.root = (x, y)
+        self.revision = revision
+
+    def distance(self, x, y):
+        return self.distances[y * self.w + x]
+
+    def downhill(self, x, y, is_blocked=None):
+        return downhill(self.distances, self.w, self.h, x, y, is_blocked)
+
+    def close(self):
+        if self.dijkstra is not None:
+            libtcod.dijkstra_delete(self.dijkstra)
+            self.dijkstra = None
+
+def relax(values, walkable, w, h, limit=FAR):
+    #turn a signed ('i') plane of starting values, FAR where there is none, into the
+    #lowest value reachable at every walkable cell: the cell's own, or a neighbour's plus
+    #the step there. Sources start at 0 for distances to the nearest of them, but any
+    #values work (see FleeMap). walkable is a 0/1 byte plane or string. Values over
+    #limit are left FAR, which also bounds the work to the cells within limit.
+    if numpy_available:
+        grid = planes.grid(values, w)
+        current = grid.astype('int64')
+        blocked = numpy.frombuffer(str(walkable), dtype='uint8').reshape(h, w) == 0
+        current[blocked] = FAR
+        padded = numpy.empty((h + 2, w + 2), dtype='int64')
+        padded.fill(FAR)
+        sweeps = 0
+        while limit == FAR or sweeps * STRAIGHT <= limit:
+            #one sweep of every cell against its 8 neighbours, until nothing improves; after
+            #n sweeps every value n steps or less from where it came from is right
+            sweeps += 1
+            padded[1:-1, 1:-1] = current
+            lowest = current.copy()
+            for (dx, dy) in NEIGHBOURS:
+                step = DIAGONAL if dx and dy else STRAIGHT
+                numpy.minimum(lowest, padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w] + step, lowest)
+            lowest[blocked] = FAR
+            numpy.minimum(lowest, FAR, lowest)
+            if numpy.array_equal(lowest, current):
+                break
+            current = lowest
+        current[current > limit] = FAR
+        grid[:] = current
+        return
+    #without NumPy: dijkstra with every cell that has a value as a source
+    walkable = bytearray(walkable)
+    queue = [(value, i) for (i, value) in enumerate(values) if value != FAR and value <= limit and walkable[i]]
+    for i, value in enumerate(values):
+        if not walkable[i] or value > limit:
+            values[i] = FAR
+    heapq.heapify(queue)
+    while queue:
+        value, i = heapq.heappop(queue)
+        if value > values[i]:
+            continue
+        x, y = i % w, i / w
+        for (dx, dy) in NEIGHBOURS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < w and 0 <= ny < h:
+                j = ny * w + nx
+                new_value = value + (DIAGONAL if dx and dy else STRAIGHT)
+                if walkable[j] and new_value < values[j] and new_value <= limit:
+                    values[j] = new_value
+                    heapq.heappush(queue, (new_value, j))
+
+class SourceMap:
+    #the distance from every cell of a level to the nearest of many sources (all the items,
+    #exits, allies...), in hundredths of a step, up to SOURCE_RANGE (FAR further away).
+    #sources() lists their (x, y); the map is only recomputed when that list or the
+    #level's tiles changed since the last update().
+    def __init__(self, level, sources):
+        self.level = level
+        self.w, self.h = level.w, level.h
+        self.sources = sources
+        self.distances = planes.new_plane(self.w * self.h, FAR, 'i')
+        self.key = None
+
+    def update(self):
+        sources = sorted(set(self.sources()))
+        key = (self.level.revision, sources)
+        if key != self.key:
+            planes.fill(self.distances, 0, len(self.distances), FAR)
+            for (x, y) in sources:
+                self.distances[y * self.w + x] = 0
+            relax(self.distances, planes.negate(self.level.blocked), self.w, self.h, SOURCE_RANGE)
+            self.key = key
+        return self
+
+    def distance(self, x, y):
+        return self.distances[y * self.w + x]
+
+    def downhill(self, x, y, is_blocked=None):
+        return downhill(self.distances, self.w, self.h, x, y, is_blocked)
+
+class FleeMap(SourceMap):
+    #for running away from what a chase map (a DistanceMap, or its update function) leads to.
+    #Walking downhill on the chase map scaled by FLEE_SCALE, a negative number, would go to
+    #the farthest dead end; relaxing it again makes cells next to a way out lower still,
+    #so fleeing monsters slip past rather than get cornered. Only the cells within
+    #FLEE_RADIUS of the chase map's root are worked out, the others are FAR.
+    def __init__(self, level, chase):
+        SourceMap.__init__(self, level, None)
+        self.chase = chase
+
+    def update(self):
+        chase = self.chase()
+        key = (self.level.revision, chase.root, chase.revision)
+        if key != self.key:
+            #relax the window around the root on its own, then put it in a plane of FAR
+            w, h, r = self.w, self.h, FLEE_RADIUS
+            (x, y) = chase.root
+            x0, y0, x1, y1 = max(0, x - r), max(0, y - r), min(w, x + r + 1), min(h, y + r + 1)
+            rows = range(y0, y1)
+            ww = x1 - x0
+            window = planes.new_plane(ww * len(rows), FAR, 'i')
+            if numpy_available:
+                chased = planes.grid(chase.distances, w)[y0:y1, x0:x1]
+                planes.grid(window, ww)[:] = numpy.where(
+                    chased == UNREACHABLE, FAR, (chased * FLEE_SCALE).astype('int64'))
+            else:
+                window[:] = planes.from_values(
+                    [FAR if distance == UNREACHABLE else int(distance * FLEE_SCALE)
+                     for row in rows for distance in chase.distances[row * w + x0:row * w + x1]], 'i')
+            blocked = self.level.blocked
+            walkable = ''.join(planes.negate(blocked[row * w + x0:row * w + x1]) for row in rows)
+            relax(window, walkable, ww, len(rows))
+            distances = self.distances
+            planes.fill(distances, 0, len(distances), FAR)
+            for (n, row) in enumerate(rows):
+                distances[row * w + x0:row * w + x1] = window[n * ww:(n + 1) * ww]
+            self.key = key
+        return self
@@ -0,0 +1,86 @@
+import libtcodpy as libtcod
+import planes
+from planes import numpy_available
+from distmap import DistanceMap, NEIGHBOURS, UNREACHABLE, downhill
+from collections import OrderedDict
+
+if numpy_available:
+    import numpy
+
+# Flow fields: for every cell of a map, the step to take towards one goal. A field is
+# computed once per goal and any number of actors follow it, instead of each of them
+# searching its own path (eg. a crowd of monsters converging on a noise).
+
+FLOW_FIELDS = 8  #fields kept per map, least recently used goes first
+STAY = len(NEIGHBOURS)  #direction of the cells no step gets closer from (the goal, or unreachable)
+UNKNOWN = 255  #direction not worked out yet
+
+class FlowField:
+    #the directions towards the root of a computed DistanceMap. It keeps its own copy
+    #of the distances, so the DistanceMap can go on to compute the next field.
+    def __init__(self, distance_map):
+        self.w, self.h = distance_map.w, distance_map.h
+        self.goal = distance_map.root
+        self.distances = planes.from_values(distance_map.distances, 'I')
+        self.directions = planes.new_plane(self.w * self.h, UNKNOWN)
+        if numpy_available:
+            self._all_directions()
+
+    def _all_directions(self):
+        #the direction of every cell at once: the lowest of the 8 neighbours, if lower than the cell
+        w, h = self.w, self.h
+        distances = planes.grid(self.distances, w)
+        padded = numpy.empty((h + 2, w + 2), dtype=distances.dtype)
+        padded.fill(UNREACHABLE)
+        padded[1:-1, 1:-1] = distances
+        around = numpy.array([padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w] for (dx, dy) in NEIGHBOURS])
+        best = around.argmin(axis=0)
+        lowest = around.min(axis=0)
+        planes.grid(self.directions, w)[:] = numpy.where(lowest < distances, best, STAY)
+
+    def direction(self, x, y):
+        i = y * self.w + x
+        if self.directions[i] == UNKNOWN:
+            step = downhill(self.distances, self.w, self.h, x, y)
+            self.directions[i] = STAY if step is None else NEIGHBOURS.index(step)
+        return self.directions[i]
+
+    def step(self, x, y, is_blocked=None):
+        #the step (dx, dy) from (x, y) towards the goal, or None if there is none. If
+        #is_blocked(x, y) rules out the best cell, the next best one that still gets closer
+        direction = self.direction(x, y)
+        if direction == STAY:
+            return None
+        (dx, dy) = NEIGHBOURS[direction]
+        if is_blocked is None or not is_blocked(x + dx, y + dy):
+            return (dx, dy)
+        return downhill(self.distances, self.w, self.h, x, y, is_blocked)
+
+class FlowFields:
+    #the flow fields of a map, by goal. They are all dropped when a tile changes.
+    def __init__(self, level, size=FLOW_FIELDS):
+        self.level = level
+        self.size = size
+        self.walk_map = libtcod.map_new(level.w, level.h)
+        self.changes = level.watch()
+        self.distance_map = DistanceMap(self.walk_map, level.w, level.h)
+        self.fields = OrderedDict()  #(x, y) -> FlowField
+
+    def towards(self, x, y):
+        if self.changes.everything or self.changes.cells:
+            self.fields.clear()
+            self.level.sync_fov(self.walk_map, self.changes)
+        field = self.fields.pop((x, y), None)
+        if field is None:
+            self.distance_map.compute(x, y)
+            field = FlowField(self.distance_map)
+        self.fields[(x, y)] = field
+        while len(self.fields) > self.size:
+            self.fields.popitem(last=False)
+        return field
+
+    def close(self):
+        if self.walk_map is not None:
+            self.distance_map.close()
+            libtcod.map_delete(self.walk_map)
+            self.walk_map = None
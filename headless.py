@@ -0,0 +1,96 @@
+#!/bin/python
+
+# Runs the game without a window or font: map generation, AI turns and combat are driven
+# by a script of key presses instead of a player, for balancing runs and load tests.
+#
+#   python headless.py --seed 42 --turns 5000
+#
+# A script is a sequence of commands. A one character string is a key press ('w', 'a', 's',
+# 'd' to move, 'g' to pick up, 'i' then a letter to use an item, 'm' to regenerate the map),
+# ESCAPE quits, an (x, y) tuple answers a targeting prompt and None cancels one (outside a
+# prompt, both are skipped).
+
+import libtcodpy as libtcod
+import pyRL
+import time
+import argparse
+
+ESCAPE = 'escape'
+MOVES = 'wasd'
+
+def make_key(command):
+    key = libtcod.Key()
+    if command == ESCAPE:
+        key.vk = libtcod.KEY_ESCAPE
+    else:
+        key.vk = libtcod.KEY_CHAR
+        key.c = ord(command)
+    return key
+
+class ScriptedInput:
+    #feeds the game's menus and targeting prompts from the script, see pyRL.scripted_input
+    def __init__(self, script):
+        self.commands = iter(script)
+
+    def next_command(self):
+        return next(self.commands, ESCAPE)
+
+    def next_key(self):
+        command = self.next_command()
+        if isinstance(command, tuple) or command is None:
+            return libtcod.Key()  #not a key, cancels the menu
+        return make_key(command)
+
+    def next_target(self):
+        command = self.next_command()
+        if isinstance(command, tuple):
+            return command
+        return (None, None)
+
+def random_script(turns, seed=None):
+    #a random walk that picks up whatever it stands on now and then
+    rng = libtcod.random_new_from_seed(seed) if seed is not None else 0
+    for i in range(turns):
+        if libtcod.random_get_int(rng, 0, 9) == 0:
+            yield 'g'
+        else:
+            yield MOVES[libtcod.random_get_int(rng, 0, len(MOVES) - 1)]
+
+def run(script, seed=None, map_width=pyRL.MAP_WIDTH, map_height=pyRL.MAP_HEIGHT):
+    #play a script through to its end, the player's death or an ESCAPE; returns some statistics
+    pyRL.new_game(seed=seed, map_width=map_width, map_height=map_height)
+    pyRL.scripted_input = ScriptedInput(script)
+    turns = 0
+    start = time.time()
+    try:
+        while pyRL.game_state == 'playing':
+            pyRL.update_fov()
+            command = pyRL.scripted_input.next_command()
+            if isinstance(command, tuple) or command is None:
+                continue  #a target answer no prompt asked for: not a key, skip it
+            action = pyRL.handle_keys(pyRL.game_state, make_key(command))
+            if action == 'exit':
+                break
+            if action != 'didnt-take-turn':
+                pyRL.take_monster_turns()
+                turns += 1
+    finally:
+        pyRL.scripted_input = None
+    elapsed = time.time() - start
+    return {'turns': turns,
+            'seconds': elapsed,
+            'turns_per_second': turns / elapsed if elapsed > 0 else None,
+            'game_state': pyRL.game_state,
+            'player_hp': pyRL.player.fighter.hp if pyRL.player.fighter else 0,
+            'monsters_alive': len([o for o in pyRL.map.objects if o.ai]),
+            'messages': [line for (line, color) in pyRL.game_msgs]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run pyRL without a window.')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--turns', type=int, default=1000)
+    parser.add_argument('--width', type=int, default=pyRL.MAP_WIDTH)
+    parser.add_argument('--height', type=int, default=pyRL.MAP_HEIGHT)
+    args = parser.parse_args()
+    result = run(random_script(args.turns, args.seed), args.seed, args.width, args.height)
+    print '%(turns)d turns in %(seconds).3fs, game %(game_state)s, player hp %(player_hp)d, %(monsters_alive)d monsters left' % result
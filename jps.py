@@ -0,0 +1,129 @@
+import heapq
+from geometry import Pos
+
+# Jump point search: A* for grids where every step costs the same (1 straight, DIAGONAL_COST
+# diagonally), that only puts the cells where a path may have to turn (the jump points) in
+# its open list, and skips over the runs of open floor between them.
+# Like libtcod's paths, diagonal steps may cut corners.
+# Experimental: its paths cost the same as libtcod's A*, but being pure python it is some
+# 35x slower than it (see paths.JPS), so it is not used unless asked for.
+
+DIAGONAL_COST = 1.41
+
+def _octile(dx, dy):
+    dx, dy = abs(dx), abs(dy)
+    return max(dx, dy) + (DIAGONAL_COST - 1) * min(dx, dy)
+
+def _sign(n):
+    return (n > 0) - (n < 0)
+
+class JumpPointSearch:
+    #walk is a byte buffer with one value per cell, row by row, non zero where a path may go
+    def __init__(self, walk, w, h):
+        self.walk = walk
+        self.w = w
+        self.h = h
+
+    def _walkable(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h and self.walk[y * self.w + x]
+
+    def _jump_straight(self, x, y, dx, dy, goal):
+        #from (x, y) on, step by (dx, dy) (one of them 0) up to the next jump point, or None
+        walkable = self._walkable
+        while True:
+            x, y = x + dx, y + dy
+            if not walkable(x, y):
+                return None
+            if (x, y) == goal:
+                return (x, y)
+            if dx:
+                if (walkable(x + dx, y + 1) and not walkable(x, y + 1)) or \
+                   (walkable(x + dx, y - 1) and not walkable(x, y - 1)):
+                    return (x, y)
+            else:
+                if (walkable(x + 1, y + dy) and not walkable(x + 1, y)) or \
+                   (walkable(x - 1, y + dy) and not walkable(x - 1, y)):
+                    return (x, y)
+
+    def _jump(self, x, y, dx, dy, goal):
+        if not (dx and dy):
+            return self._jump_straight(x, y, dx, dy, goal)
+        walkable = self._walkable
+        while True:
+            x, y = x + dx, y + dy
+            if not walkable(x, y):
+                return None
+            if (x, y) == goal:
+                return (x, y)
+            if (walkable(x - dx, y + dy) and not walkable(x - dx, y)) or \
+               (walkable(x + dx, y - dy) and not walkable(x, y - dy)):
+                return (x, y)
+            if self._jump_straight(x, y, dx, 0, goal) or self._jump_straight(x, y, 0, dy, goal):
+                return (x, y)
+
+    def _directions(self, x, y, parent):
+        #the directions worth searching from (x, y), reached from parent (None at the start)
+        if parent is None:
+            return [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+        walkable = self._walkable
+        dx, dy = _sign(x - parent[0]), _sign(y - parent[1])
+        if dx and dy:
+            directions = [(0, dy), (dx, 0), (dx, dy)]
+            if not walkable(x - dx, y):
+                directions.append((-dx, dy))
+            if not walkable(x, y - dy):
+                directions.append((dx, -dy))
+        elif dx:
+            directions = [(dx, 0)]
+            if not walkable(x, y + 1):
+                directions.append((dx, 1))
+            if not walkable(x, y - 1):
+                directions.append((dx, -1))
+        else:
+            directions = [(0, dy)]
+            if not walkable(x + 1, y):
+                directions.append((1, dy))
+            if not walkable(x - 1, y):
+                directions.append((-1, dy))
+        return directions
+
+    def find_path(self, start, goal):
+        #the cells from start (excluded) to goal as Pos, [] if there's no path
+        start, goal = (start.x, start.y), (goal.x, goal.y)
+        if start == goal or not self._walkable(*goal):
+            return []
+        costs, parents = {start: 0}, {start: None}
+        queue = [(_octile(goal[0] - start[0], goal[1] - start[1]), start)]
+        while queue:
+            estimate, point = heapq.heappop(queue)
+            if point == goal:
+                return self._cells(parents, goal)
+            cost = costs[point]
+            if estimate > cost + _octile(goal[0] - point[0], goal[1] - point[1]):
+                continue
+            x, y = point
+            for (dx, dy) in self._directions(x, y, parents[point]):
+                jump_point = self._jump(x, y, dx, dy, goal)
+                if jump_point is None:
+                    continue
+                new_cost = cost + _octile(jump_point[0] - x, jump_point[1] - y)
+                if new_cost < costs.get(jump_point, new_cost + 1):
+                    costs[jump_point], parents[jump_point] = new_cost, point
+                    heapq.heappush(queue, (new_cost + _octile(goal[0] - jump_point[0], goal[1] - jump_point[1]), jump_point))
+        return []
+
+    def _cells(self, parents, goal):
+        #fill in the straight and diagonal runs between the jump points
+        points = []
+        point = goal
+        while point is not None:
+            points.append(point)
+            point = parents[point]
+        points.reverse()
+        cells = []
+        for (x, y), (to_x, to_y) in zip(points, points[1:]):
+            dx, dy = _sign(to_x - x), _sign(to_y - y)
+            while (x, y) != (to_x, to_y):
+                x, y = x + dx, y + dy
+                cells.append(Pos(x, y))
+        return cells
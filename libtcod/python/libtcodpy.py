@@ -28,6 +28,7 @@
 import sys
 import ctypes
 import struct
+import operator
 from ctypes import *
 
 if not hasattr(ctypes, "c_bool"):   # for Python < 2.6
@@ -1556,6 +1557,88 @@ def map_get_width(map):
 def map_get_height(map):
     return _lib.TCOD_map_get_height(map)
 
+# bulk access to the cells of a map. This mirrors libtcod's internal map_t:
+# every cell is one byte of bit fields (transparent, walkable, fov), lowest bit first.
+class _CMap(Structure):
+    _fields_=[('width', c_int),
+              ('height', c_int),
+              ('nbcells', c_int),
+              ('cells', POINTER(c_uint8))]
+
+_CELL_TRANSPARENT = 1
+_CELL_WALKABLE = 2
+_CELL_FOV = 4
+_WALKABLE_BITS = ''.join(chr(_CELL_WALKABLE if i else 0) for i in range(256))
+
+def _map_data(m):
+    return cast(c_void_p(m), POINTER(_CMap)).contents
+
+def map_set_properties_bulk(m, transparent, walkable):
+    # transparent and walkable are byte buffers (str, bytearray, array('B') or a
+    # uint8/bool numpy array) with one 0/1 value per cell, row by row.
+    # All cells are written with a single memmove; this also clears the fov flags.
+    data = _map_data(m)
+    n = data.nbcells
+    if len(transparent) != n or len(walkable) != n:
+        raise TypeError('transparent and walkable must have one value per map cell.')
+
+    if numpy_available:
+        t = numpy.frombuffer(transparent, dtype=numpy.uint8) != 0
+        w = numpy.frombuffer(walkable, dtype=numpy.uint8) != 0
+        cells = numpy.ascontiguousarray(t * _CELL_TRANSPARENT + w * _CELL_WALKABLE, dtype=numpy.uint8)
+        memmove(data.cells, cells.ctypes.data, n)
+    else:
+        cells = bytearray(map(operator.or_, bytearray(transparent),
+                              bytearray(walkable).translate(_WALKABLE_BITS)))
+        memmove(data.cells, (c_uint8 * n).from_buffer(cells), n)
+
+def _cell_bit_table(bit):
+    return ''.join(chr(int(bool(i & bit))) for i in range(256))
+
+_TRANSPARENT_TABLE = _cell_bit_table(_CELL_TRANSPARENT)
+_WALKABLE_TABLE = _cell_bit_table(_CELL_WALKABLE)
+_FOV_TABLE = _cell_bit_table(_CELL_FOV)
+
+def _map_get_cells(m, table, out):
+    # copy every cell out with one memcpy, then pick one flag out of each byte
+    data = _map_data(m)
+    n = data.nbcells
+    flags = string_at(data.cells, n).translate(table)
+    if out is None:
+        return bytearray(flags)
+    if numpy_available and isinstance(out, numpy.ndarray):
+        if out.size != n:
+            raise TypeError('out must have one value per map cell.')
+        out.reshape(-1)[:] = numpy.frombuffer(flags, dtype=numpy.uint8)
+        return out
+    if len(out) != n:
+        raise TypeError('out must have one value per map cell.')
+    if hasattr(out, 'buffer_info') and out.itemsize == 1:
+        # array.array('B'): copy straight into its memory
+        memmove(out.buffer_info()[0], flags, n)
+    else:
+        out[:] = flags
+    return out
+
+# these fill out (a bytearray, array('B') or numpy array with one element per
+# cell, row by row) with 0/1 flags, or return a new bytearray if out is None
+def map_get_fov(m, out=None):
+    return _map_get_cells(m, _FOV_TABLE, out)
+
+def map_get_transparent(m, out=None):
+    return _map_get_cells(m, _TRANSPARENT_TABLE, out)
+
+def map_get_walkable(m, out=None):
+    return _map_get_cells(m, _WALKABLE_TABLE, out)
+
+# the 0/1 fov flags of the cells x0 <= x < x1, y0 <= y < y1 only, row by row, as
+# a string: one memcpy per row instead of one of the whole map
+def map_get_fov_rect(m, x0, y0, x1, y1):
+    data = _map_data(m)
+    cells = addressof(data.cells.contents)
+    return ''.join([string_at(cells + y * data.width + x0, x1 - x0)
+                    for y in range(y0, y1)]).translate(_FOV_TABLE)
+
 ############################
 # pathfinding module
 ############################
@@ -1623,10 +1706,19 @@ def dijkstra_new(m, dcost=1.41):
 
 def dijkstra_new_using_function(w, h, func, userdata=0, dcost=1.41):
     cbk_func = PATH_CBK_FUNC(func)
-    return (_lib.TCOD_path_dijkstra_using_function(w, h, cbk_func,
+    return (_lib.TCOD_dijkstra_new_using_function(w, h, cbk_func,
             py_object(userdata), c_float(dcost)), cbk_func)
 
 def dijkstra_compute(p, ox, oy):
+    # TCOD_dijkstra_compute goes on through its whole node queue past the nodes it
+    # queued, relaxing whatever cells an earlier compute (or malloc) left there: from
+    # an unreachable one the distance wraps around, and cells cut off from the root
+    # get distances of 99 or 140. With the queue filled with the root first, those
+    # extra steps find nothing to improve.
+    data = cast(c_void_p(p[0]), POINTER(_CDijkstra)).contents
+    if 0 <= ox < data.width and 0 <= oy < data.height:
+        roots = struct.pack('I', oy * data.width + ox) * data.nodes_max
+        memmove(data.nodes, roots, len(roots))
     _lib.TCOD_dijkstra_compute(p[0], c_int(ox), c_int(oy))
 
 def dijkstra_path_set(p, x, y):
@@ -1660,6 +1752,44 @@ def dijkstra_path_walk(p):
 def dijkstra_delete(p):
     _lib.TCOD_dijkstra_delete(p[0])
 
+# mirrors libtcod's internal dijkstra_t, to read the whole distance grid at once
+class _CDijkstra(Structure):
+    _fields_=[('diagonal_cost', c_int),
+              ('width', c_int),
+              ('height', c_int),
+              ('nodes_max', c_int),
+              ('map', c_void_p),
+              ('func', c_void_p),
+              ('user_data', c_void_p),
+              ('distances', POINTER(c_uint)),
+              ('nodes', POINTER(c_uint)),
+              ('path', c_void_p)]
+
+DIJKSTRA_UNREACHABLE = 0xFFFFFFFF
+
+def dijkstra_get_distances(p, out=None):
+    # copy the distance of every cell to the root, row by row, in hundredths of a step
+    # (DIJKSTRA_UNREACHABLE if there is no path) into out, an array('I') or uint32 numpy
+    # array with one element per cell, with a single memcpy. Returns out, or a new ctypes
+    # array if out is None.
+    data = cast(c_void_p(p[0]), POINTER(_CDijkstra)).contents
+    n = data.width * data.height
+    if out is None:
+        out = (c_uint * n)()
+    if numpy_available and isinstance(out, numpy.ndarray):
+        if out.size != n or out.dtype != numpy.uint32 or not out.flags['C_CONTIGUOUS']:
+            raise TypeError('out must be a contiguous uint32 array with one value per cell.')
+        memmove(out.ctypes.data, data.distances, n * sizeof(c_uint))
+    elif hasattr(out, 'buffer_info'):
+        if len(out) != n or out.itemsize != sizeof(c_uint):
+            raise TypeError("out must be an array('I') with one value per cell.")
+        memmove(out.buffer_info()[0], data.distances, n * sizeof(c_uint))
+    else:
+        if len(out) != n:
+            raise TypeError('out must have one value per cell.')
+        memmove(out, data.distances, n * sizeof(c_uint))
+    return out
+
 ############################
 # bsp module
 ############################
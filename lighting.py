@@ -0,0 +1,144 @@
+import math
+import planes
+from planes import numpy_available
+from itertools import izip
+
+if numpy_available:
+    import numpy
+
+# Coloured light from any number of sources (the player's torch, explosions, lightning).
+# Each source lights the cells in its field of view within its radius, at a strength that
+# falls off with the distance, and the light of every source is summed into three float
+# planes (red, green, blue; 1.0 is full brightness). A source's contribution is kept, so
+# when it moves or a tile near it changes, only that one source is taken out and lit again.
+
+AMBIENT = 0.35  #brightness of a visible cell no light reaches
+
+class Light:
+    #a light at (x, y), or following owner (anything with x and y) if there is one. color is
+    #the (r, g, b) at full strength, 0 to 255; the strength is 1 at the source and drops to 0
+    #past radius, as (1 - distance / (radius + 1)) ** falloff. A light with turns goes out
+    #after that many turns.
+    def __init__(self, x, y, radius, color, falloff=1.0, turns=None, owner=None):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.color = color
+        self.falloff = falloff
+        self.turns = turns
+        self.owner = owner
+        self.at = None  #where it was last lit from, None while not lit
+        self.lit = None  #(plane indices, strengths) it added to the planes
+
+    def position(self):
+        if self.owner is not None:
+            return (self.owner.x, self.owner.y)
+        return (self.x, self.y)
+
+_strengths = {}  #(radius, falloff) -> strength by cell of the (2r+1) x (2r+1) window
+
+def strength_table(radius, falloff):
+    key = (radius, falloff)
+    if key not in _strengths:
+        table = []
+        for dy in range(-radius, radius + 1):
+            for dx in range(-radius, radius + 1):
+                left = 1 - math.sqrt(dx * dx + dy * dy) / (radius + 1)
+                table.append(left ** falloff if left > 0 else 0.0)
+        _strengths[key] = numpy.array(table, dtype='float32') if numpy_available else table
+    return _strengths[key]
+
+class Lighting:
+    #the light on every cell of a level. visibility (a fov.Visibility) says which cells
+    #a source lights; call update() before reading the planes.
+    def __init__(self, level, visibility, ambient=AMBIENT):
+        self.level = level
+        self.visibility = visibility
+        self.ambient = ambient
+        size = level.w * level.h
+        self.planes = [planes.new_plane(size, 0.0, 'f') for c in range(3)]  #red, green, blue
+        self.lights = []
+        self.changes = level.watch()
+        self.dirty = set()  #plane indices whose light changed since update() last returned them
+
+    def add(self, light):
+        self.lights.append(light)
+        return light
+
+    def remove(self, light):
+        self.lights.remove(light)
+        self._unlight(light)
+
+    def tick(self):
+        #a turn went by: put out the lights whose time is up and count down the others
+        for light in [light for light in self.lights if light.turns is not None and light.turns <= 0]:
+            self.remove(light)
+        for light in self.lights:
+            if light.turns is not None:
+                light.turns -= 1
+
+    def _add(self, lit, color, sign):
+        #add (sign 1) or take away (sign -1) strengths of color at the given cells
+        indices, strengths = lit
+        for (plane, c) in zip(self.planes, color):
+            scale = sign * c / 255.0
+            if numpy_available:
+                numpy.frombuffer(plane, dtype='float32')[indices] += strengths * scale
+            else:
+                for (i, strength) in izip(indices, strengths):
+                    plane[i] += strength * scale
+
+    def _light(self, light):
+        x, y = light.position()
+        r, w = light.radius, self.level.w
+        cells = self.visibility.fov(x, y, r)
+        table = strength_table(r, light.falloff)
+        if numpy_available:
+            indices = numpy.fromiter(cells, dtype='int64', count=len(cells))
+            strengths = table[(indices // w - y + r) * (2 * r + 1) + indices % w - x + r]
+        else:
+            indices = list(cells)
+            strengths = [table[(i / w - y + r) * (2 * r + 1) + i % w - x + r] for i in indices]
+        light.at, light.lit = (x, y), (indices, strengths)
+        self._add(light.lit, light.color, 1)
+        self.dirty.update(cells)
+
+    def _unlight(self, light):
+        if light.lit is not None:
+            self._add(light.lit, light.color, -1)
+            self.dirty.update(light.lit[0].tolist() if numpy_available else light.lit[0])
+            light.at, light.lit = None, None
+
+    def update(self):
+        #re-light the sources that moved or have a changed tile within their radius;
+        #returns the plane indices whose light changed since the last update
+        everything, cells = self.changes.take()
+        w = self.level.w
+        changed = [(i % w, i / w) for i in cells]
+        for light in self.lights:
+            (x, y), r = light.position(), light.radius
+            if light.at == (x, y) and not everything and \
+               not any(abs(cx - x) <= r and abs(cy - y) <= r for (cx, cy) in changed):
+                continue
+            self._unlight(light)
+            self._light(light)
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def shade(self, values, channel, visible):
+        #one colour channel (0 red, 1 green, 2 blue) of a whole map, values from 0 to 255
+        #for every cell (a NumPy grid with NumPy, a list without), lit on the cells set in
+        #the 0/1 byte plane visible
+        plane = self.planes[channel]
+        if numpy_available:
+            w = self.level.w
+            light = numpy.clip(planes.grid(plane, w) + self.ambient, 0, 1)
+            return numpy.where(planes.grid(visible, w) != 0, values * light, values).astype('int32')
+        ambient = self.ambient
+        return [int(v * min(1.0, max(0.0, ambient + l))) if seen else v
+                for (v, l, seen) in izip(values, plane, visible)]
+
+    def shade_cell(self, i, color):
+        #an (r, g, b) lit with the light on the cell at plane index i
+        return tuple(int(c * min(1.0, max(0.0, self.ambient + plane[i])))
+                     for (c, plane) in zip(color, self.planes))
@@ -0,0 +1,98 @@
+import array
+import binascii
+import operator
+from itertools import izip, imap
+
+try:  #import NumPy if available
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+# Planes are flat, row-major per-cell buffers (array.array), one value per map cell.
+# Cell (x, y) of a plane w cells wide lives at index y*w + x. They are cheap to index
+# one cell at a time from python, and can be viewed as NumPy grids without copying.
+
+_DTYPES = {'B': 'uint8', 'i': 'int32', 'I': 'uint32', 'f': 'float32'}
+_NEGATE = ''.join(chr(int(i == 0)) for i in range(256))
+_WHERE = ''.join(chr(255 if i else 0) for i in range(256))
+_BITS = ''.join('1' if i else '0' for i in range(256))
+_UNBITS = ''.join(chr(c == '1') for c in map(chr, range(256)))
+
+def new_plane(size, value=0, typecode='B'):
+    return array.array(typecode, [value]) * size
+
+def from_values(values, typecode='B'):
+    return array.array(typecode, values)
+
+def fill(plane, start, stop, value):
+    #set plane[start:stop] to value
+    if stop > start:
+        plane[start:stop] = array.array(plane.typecode, [value]) * (stop - start)
+
+def grid(plane, w):
+    #a (h, w) NumPy view sharing the plane's memory; writes go through to the plane
+    return numpy.frombuffer(plane, dtype=_DTYPES[plane.typecode]).reshape(-1, w)
+
+def negate(plane):
+    #the logical not of a 0/1 byte plane, as a byte string (eg. blocked -> walkable)
+    return plane.tostring().translate(_NEGATE)
+
+def both(a, b):
+    #the logical and of two 0/1 byte planes (or byte strings), as a byte string
+    if numpy_available:
+        return (numpy.frombuffer(a, dtype='uint8') & numpy.frombuffer(b, dtype='uint8')).tostring()
+    return str(bytearray(imap(operator.and_, bytearray(a), bytearray(b))))
+
+def either(a, b):
+    #the bitwise or of two byte planes (or byte strings), as a byte string
+    if numpy_available:
+        return (numpy.frombuffer(a, dtype='uint8') | numpy.frombuffer(b, dtype='uint8')).tostring()
+    return str(bytearray(imap(operator.or_, bytearray(a), bytearray(b))))
+
+def where(a, mask):
+    #a byte plane where a 0/1 byte plane mask is set and 0 elsewhere, as a byte string
+    return both(a, mask.tostring().translate(_WHERE))
+
+def merge(plane, mask):
+    #or a 0/1 byte plane mask into a 0/1 byte plane, in place; returns the indices that
+    #went from 0 to 1
+    if numpy_available:
+        old = numpy.frombuffer(plane, dtype='uint8')
+        new = numpy.frombuffer(mask, dtype='uint8') & ~old
+        indices = numpy.flatnonzero(new).tolist()
+        old |= new
+        return indices
+    merged = array.array('B', either(plane, mask))
+    indices = changed(plane, merged)
+    plane[:] = merged
+    return indices
+
+def pack(plane):
+    #a 0/1 byte plane as a string of bits, 8 cells a byte, first cell in the high bit
+    #(the layout of numpy.packbits)
+    if numpy_available:
+        return numpy.packbits(numpy.frombuffer(plane, dtype='uint8') != 0).tostring()
+    bits = plane.tostring().translate(_BITS)
+    bits += '0' * (-len(bits) % 8)
+    if not bits:
+        return ''
+    return binascii.unhexlify('%0*x' % (len(bits) / 4, int(bits, 2)))
+
+def unpack(data, size):
+    #the first size cells of a string made by pack, as a 0/1 byte plane
+    if numpy_available:
+        return array.array('B', numpy.unpackbits(numpy.frombuffer(data, dtype='uint8'))[:size].tostring())
+    if not data:
+        return new_plane(size)
+    bits = bin(int(binascii.hexlify(data), 16))[2:].zfill(len(data) * 8)
+    return array.array('B', bits[:size].translate(_UNBITS))
+
+def changed(old, new):
+    #the indices at which two planes of the same size differ
+    if old == new:
+        return []
+    if numpy_available:
+        dtype = _DTYPES[old.typecode]
+        return numpy.flatnonzero(numpy.frombuffer(old, dtype=dtype) != numpy.frombuffer(new, dtype=dtype)).tolist()
+    return [i for i, (a, b) in enumerate(izip(old, new)) if a != b]
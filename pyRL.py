@@ -2,6 +2,17 @@
 
 import libtcodpy as libtcod
 from geometry import Rect
+from tilemap import TileMap
+from spatial import SpatialIndex
+from scheduler import Scheduler, NORMAL_SPEED, action_time
+from distmap import DistanceMap, SourceMap, FleeMap
+from flowfield import FlowFields
+from fov import Visibility, engine_for
+from lighting import Light, Lighting
+import planes
+from planes import numpy_available
+if numpy_available:
+    import numpy
 import math
 import paths
 import time
@@ -34,16 +45,23 @@ CONFUSE_NUM_TURNS = 3
 CONFUSE_RANGE = 5
 FIREBALL_RADIUS = 3
 FIREBALL_DAMAGE = 12
+NOISE_RADIUS = 15  #monsters this close hear an explosion and come to check it out
+FLEE_HP = 4  #monsters run away when down to 1/FLEE_HP of their hit points
+LIGHTING = True  #light visible cells by the light sources around, see lighting.py
+TORCH_COLOR = (255, 230, 180)
+FIREBALL_COLOR = (255, 140, 40)
+LIGHTNING_COLOR = (160, 190, 255)
+LIGHTNING_LIGHT_RADIUS = 5
+WAKE_RADIUS = TORCH_RADIUS + 2  #monsters further than this from the player sleep
 
 FOV_ALGO = 0  #default FOV algorithm
 FOV_LIGHT_WALLS = True
+FOV_WINDOWED = True  #compute the player's FOV with a fov.py engine, windowed to TORCH_RADIUS when the algorithm and map size allow
+FOV_TABLES = False  #compute FOV_SHADOW in python from tables instead of with libtcod (same cells, slower, see fov.ShadowcastFov)
+MONSTER_SIGHT = TORCH_RADIUS  #how far monsters see
+SIGHT_ALGO = libtcod.FOV_SHADOW  #FOV algorithm of monster sight and light sources, see fov.Visibility
 BACK_COLOR = libtcod.black
 LIMIT_FPS = 20
-libtcod.console_set_custom_font('tiles18x18_gs_ro.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_ASCII_INROW, 16, 25 )
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'python/libtcod tutorial', False)
-libtcod.console_set_keyboard_repeat(80,25)
-con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
-libtcod.sys_set_fps(LIMIT_FPS)
 
 color_dark_wall = libtcod.Color(50, 50, 50)
 color_light_wall = libtcod.Color(255,255,255)
@@ -53,6 +71,20 @@ fov = True
 player_action = None
 #create the list of game messages and their colors, starts empty
 game_msgs = []
+rng = 0  #random number generator for everything in the game, 0 is libtcod's default one
+#when set, menus and targeting read from this instead of the window (see headless.py)
+scripted_input = None
+map = None
+fov_map = None
+con = None
+panel = None
+player_fov = None
+visibility = None
+lighting = None
+chase_map = None
+flee_map = None
+item_map = None
+flow_fields = None
 
 
 #########################################################################
@@ -79,15 +111,15 @@ class Item:
             message('Your inventory is full, cannot pick up ' + self.owner.name + '.', libtcod.red)
         else:
             inventory.append(self.owner)
-            map.objects.remove(self.owner)
+            map.remove_object(self.owner)
             message('You picked up a ' + self.owner.name + '!', libtcod.green)
 
     def drop(self):
         #add to the map and remove from the player's inventory, also, place at player's coordinates
-        objects.append(self.owner)
         inventory.remove(self.owner)
         self.owner.x = player.x
         self.owner.y = player.y
+        map.add_object(self.owner)
         message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
 
     def use(self):
@@ -111,6 +143,7 @@ class Fighter:
         #apply damage if possible
         if damage > 0:
             self.hp -= damage
+            scheduler.wake(self.owner)
         #check for death. If there's a death function, call it.
         if self.hp <= 0:
             function = self.death_function
@@ -142,18 +175,37 @@ class Fighter:
 
 class BasicMonster:
     #AI for a basic monster.
-#a basic monster takes its turn. If you can see it, it can see you
+    noise = None  #where it heard something it is going to check out
+#a basic monster takes its turn, after the player if it can see them
     def take_turn(self):
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
-            #move towards player if far away
-            if monster.distance_to(player) >= 2:
-                monster.move_towards(player.x, player.y)
+        if visibility.can_see(monster, player, MONSTER_SIGHT):
+            self.noise = None
+            step = None
+            if monster.fighter.hp * FLEE_HP <= monster.fighter.max_hp:
+                #badly hurt: run away, walking down the shared flee map
+                step = flee_map.update().downhill(monster.x, monster.y, lambda x, y: is_blocked(x, y, map))
+            if step is not None:
+                monster.move(*step)
+
+            #cornered or not hurt: move towards player if far away, walking down the shared distance map
+            elif monster.distance_to(player) >= 2:
+                step = chase_player().downhill(monster.x, monster.y, lambda x, y: is_blocked(x, y, map))
+                if step is not None:
+                    monster.move(*step)
 
             #close enough, attack! (if the player is still alive.)
             elif player.fighter.hp > 0:
                 monster.fighter.attack(player)
 
+        elif self.noise is not None:
+            #go and see, following the flow field every monster that heard it shares
+            step = flow_fields.towards(*self.noise).step(monster.x, monster.y, lambda x, y: is_blocked(x, y, map))
+            if step is None:
+                self.noise = None  #got there, or can't get any closer
+            else:
+                monster.move(*step)
+
 
 class ConfusedMonster:
     #AI for a temporarily confused monster (reverts to previous AI after a while).
@@ -163,10 +215,18 @@ class ConfusedMonster:
 
     def take_turn(self):
         if self.num_turns > 0:  #still confused...
-            #move in a random direction 0 is up-left, 2 is up,right, 8 is down-right
-            direction = libtcod.random_get_int(0,0,8)
-            if (direction != 4): # 4 is no movement
-                self.owner.move(direction%3 -1,direction/3 -1)
+            #half the time it panics and runs from the player, otherwise it stumbles around
+            monster = self.owner
+            step = None
+            if libtcod.random_get_int(rng, 0, 1) == 0:
+                step = flee_map.update().downhill(monster.x, monster.y, lambda x, y: is_blocked(x, y, map))
+            if step is not None:
+                monster.move(*step)
+            else:
+                #move in a random direction 0 is up-left, 2 is up,right, 8 is down-right
+                direction = libtcod.random_get_int(rng,0,8)
+                if (direction != 4): # 4 is no movement
+                    monster.move(direction%3 -1,direction/3 -1)
             self.num_turns -= 1
 
         else:  #restore the previous AI (this one will be deleted because it's not referenced anymore)
@@ -180,54 +240,75 @@ class DragonAI:
  
     def take_turn(self):
         if self.state == 'chasing':
-            return
+            #after the player while it can see them, otherwise back to the nearest treasure
+            dragon = self.owner
+            if visibility.can_see(dragon, player, MONSTER_SIGHT):
+                distances = chase_player()
+            else:
+                distances = item_map.update()
+            step = distances.downhill(dragon.x, dragon.y, lambda x, y: is_blocked(x, y, map))
+            if step is not None:
+                dragon.move(*step)
         elif self.state == 'charging-fire-breath':
             return
 
 
 #########################################################################
-###                         Tile Class                                ###
+###                         Map Class                                 ###
 #########################################################################
 
-class Tile:
-    #a tile of the map and its properties
-    def __init__(self, blocked, block_sight = None):
-        self.blocked = blocked
-        self.explored = False
+class Map(TileMap):
+    def __init__(self, w, h, objects=()):
+        TileMap.__init__(self, w, h)
+        self.set_objects(objects)
+        self.path_finder = paths.PathFinder.acquire(self)
+        self.path_cache = paths.PathCache(self)
+        self.cost_planes = paths.CostPlanes(self)
 
-        #by default, if a tile is blocked, it also blocks sight
-        if block_sight is None: block_sight = blocked
-        self.block_sight = block_sight
+    def close(self):
+        #give back the native pathfinder, for the next map of this size
+        if self.path_finder is not None:
+            self.path_finder.release()
+            self.path_finder = None
 
+    def set_objects(self, objects):
+        #replace all the objects on the map
+        self.objects = list(objects)
+        self.index = SpatialIndex(self.objects)
 
-#########################################################################
-###                         Map Class                                 ###
-#########################################################################
+    def add_object(self, obj):
+        self.objects.append(obj)
+        self.index.add(obj)
 
-class Map:
-    def __init__(self, w, h):
-        self.w = w
-        self.h = h
-        self.tiles = []
-        self.objects = [npc, player] 
+    def remove_object(self, obj):
+        self.objects.remove(obj)
+        self.index.remove(obj)
 
-    def generate_map(self):
+    def solid_object_at(self, pos):
+        #used by the pathfinder to avoid blocking objects
+        return self.index.blocking_at(pos.x, pos.y) is not None
 
-        #fill map with "unblocked" tiles
-        self.tiles = [[ Tile(True)
-           for y in range(MAP_HEIGHT) ]
-               for x in range(MAP_WIDTH) ]
+    def place_object(self, obj, x, y):
+        #move an object that is on the map to (x, y)
+        old_x, old_y = obj.x, obj.y
+        obj.x, obj.y = x, y
+        self.index.move(obj, old_x, old_y)
+
+    def generate_map(self, max_rooms=MAX_ROOMS, max_room_monsters=MAX_ROOM_MONSTERS):
+
+        #fill map with "blocked" tiles
+        self.fill(True)
 
         rooms = []
         num_rooms = 0
 
-        for r in range(MAX_ROOMS):
+        for r in range(max_rooms):
             #random width and height
-            w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-            h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            w = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            h = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
             #random position without going out of the boundaries of the map
-            x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-            y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
+            x = libtcod.random_get_int(rng, 0, self.w - w - 1)
+            y = libtcod.random_get_int(rng, 0, self.h - h - 1)
 
             #"Rect" class makes rectangles easier to work with
             new_room = Rect(x, y, w, h)
@@ -244,17 +325,15 @@ class Map:
 
                 #"paint" it to the map's tiles
                 create_room(new_room)
-                place_objects(new_room)
+                place_objects(new_room, max_room_monsters)
 
                 #center coordinates of new room, will be useful later
                 (new_x, new_y) = new_room.center()
 
                 if num_rooms == 0:
                     #this is the first room, where the player starts at
-                    player.x = new_x
-                    player.y = new_y
-                    npc.x = new_x + 1
-                    npc.y = new_y + 1
+                    self.place_object(player, new_x, new_y)
+                    self.place_object(npc, new_x + 1, new_y + 1)
 
                 else:
                     #all rooms after the first:
@@ -264,7 +343,7 @@ class Map:
                     (prev_x, prev_y) = rooms[num_rooms-1].center()
 
                     #draw a coin (random number that is either 0 or 1)
-                    if libtcod.random_get_int(0, 0, 1) == 1:
+                    if libtcod.random_get_int(rng, 0, 1) == 1:
                         #first move horizontally, then vertically
                         create_h_tunnel(prev_x, new_x, prev_y)
                         create_v_tunnel(prev_y, new_y, new_x)
@@ -277,9 +356,6 @@ class Map:
                 rooms.append(new_room)
                 num_rooms += 1
 
-    def at(self, x, y):
-        return self.tiles[x][y]
-
 #########################################################################
 ###                         Object Class                              ###
 #########################################################################
@@ -287,13 +363,14 @@ class Map:
 class Object:
     #this is a generic object: the player, a monster, an item, the stairs...
     #it's always represented by a character on screen.
-    def __init__(self, x, y, char, name, color, blocks=False, fighter=None, ai=None, item=None):
+    def __init__(self, x, y, char, name, color, blocks=False, fighter=None, ai=None, item=None, speed=NORMAL_SPEED):
         self.x = x
         self.y = y
         self.char = char
         self.name = name
         self.color = color
         self.blocks = blocks
+        self.speed = speed
         self.fighter = fighter
         self.item = item
         if self.item:  #let the Item component know who owns it
@@ -307,12 +384,11 @@ class Object:
     def move(self, dx, dy):
         #move by the given amount
         if not is_blocked(self.x + dx, self.y + dy, map):
-            self.x += dx
-            self.y += dy
+            map.place_object(self, self.x + dx, self.y + dy)
 
-    def draw(self, fovMap, fov):
+    def draw(self, fov):
         #set the color and then draw the character that represents this object at its position
-        if libtcod.map_is_in_fov(fovMap, self.x, self.y) or not fov:
+        if in_fov(self.x, self.y) or not fov:
             libtcod.console_set_default_foreground(con, self.color)
             libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
     def clear(self):
@@ -365,10 +441,20 @@ def cast_fireball():
     if x is None: return 'cancelled'
     message('The fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
  
-    for obj in map.objects:  #damage every fighter in range, including the player
-        if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
+    for obj in map.index.in_radius(x, y, FIREBALL_RADIUS):  #damage every fighter in range, including the player
+        if obj.fighter:
             message('The ' + obj.name + ' gets burned for ' + str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
             obj.fighter.take_damage(FIREBALL_DAMAGE)
+    make_noise(x, y, NOISE_RADIUS)
+    if lighting is not None:
+        lighting.add(Light(x, y, FIREBALL_RADIUS + 2, FIREBALL_COLOR, falloff=0.5, turns=1))
+
+def make_noise(x, y, radius):
+    #the monsters that hear it wake up and come to (x, y)
+    for obj in map.index.in_radius(x, y, radius):
+        if isinstance(obj.ai, BasicMonster):
+            obj.ai.noise = (x, y)
+            scheduler.wake(obj)
 
 def cast_confuse():
     #ask the player for target to confuse
@@ -393,8 +479,7 @@ def get_names_under_mouse():
     #return a string with the names of all objects under the mouse
     (x, y) = (mouse.cx, mouse.cy)
     #create a list with the names of all objects at the mouse's coordinates and in FOV
-    names = [obj.name for obj in map.objects
-       if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = [obj.name for obj in map.index.at(x, y) if in_fov(obj.x, obj.y)]
     names = ', '.join(names)  #join the names, separated by commas
     return names.capitalize()
 
@@ -406,6 +491,7 @@ def handle_keys(game_state, key):
     if key.vk == libtcod.KEY_ENTER and key.lalt:
         #Alt+Enter: toggle fullscreen
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
+        invalidate_screen()
 
     elif key.vk == libtcod.KEY_ESCAPE:
         return 'exit'  #exit game
@@ -440,8 +526,8 @@ def handle_keys(game_state, key):
                     chosen_item.use()
             elif key_char == 'g':
                 #pick up an item
-                for object in map.objects:  #look for an item in the player's tile
-                    if object.x == player.x and object.y == player.y and object.item:
+                for object in map.index.at(player.x, player.y):  #look for an item in the player's tile
+                    if object.item:
                         object.item.pick_up()
                         break
             elif key_char == 'd':
@@ -452,17 +538,25 @@ def handle_keys(game_state, key):
 
     if key.vk == libtcod.KEY_CHAR:
         if key.c == ord('m'):
-            map.objects = [npc, player]
+            map.set_objects([npc, player])
             map.generate_map()
+            schedule_monsters()
             fov_recompute = True
         elif key.c == ord('f'):
             fov = not fov
+            invalidate_screen()
 
     return 'didnt-take-turn'
 
 def menu(header, options, width, back_color=libtcod.blue, text_color=libtcod.white):
     if len(options) > 26: raise ValueError('Cannot have a menu with more than 26 options.')
 
+    if scripted_input is not None:
+        key = scripted_input.next_key()
+        index = key.c - ord('a')
+        if index >= 0 and index < len(options): return index
+        return None
+
     #calculate total height for the header (after auto-wrap) and one line per option
     header_height = libtcod.console_get_height_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
     height = len(options) + header_height
@@ -489,6 +583,7 @@ def menu(header, options, width, back_color=libtcod.blue, text_color=libtcod.whi
     x = SCREEN_WIDTH/2 - width/2
     y = SCREEN_HEIGHT/2 - height/2
     libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 1.0) #opacity of fg, bg = 1.0, 1.0
+    invalidate_screen()
 
     #present the root console to the player and wait for a key-press
     libtcod.console_flush()
@@ -521,8 +616,8 @@ def player_move_or_attack(dx, dy):
 
     #try to find an attackable object there
     target = None
-    for object in map.objects:
-        if object.fighter and object.x == x and object.y == y:
+    for object in map.index.at(x, y):
+        if object.fighter:
             target = object
             break
 
@@ -548,88 +643,197 @@ def message(new_msg, color = libtcod.white):
         #add the new line as a tuple, with the text and the color
         game_msgs.append( (line, color) )
 
-def render_all():
-    global fov_recompute, fov_map
-    #draw all objects in the list
-    if fov_recompute:
-        #recompute FOV if needed (the player moved or something)
-        fov_recompute = False
+def update_fov():
+    #recompute FOV if needed (the player moved or something); returns the cells whose visibility changed
+    global fov_recompute
+    if not fov_recompute:
+        return []
+    fov_recompute = False
+    #whatever came into view is explored now
+    if FOV_WINDOWED:
+        changed = player_fov.compute(player.x, player.y)
+        #only the window around the player changed, no need to go over the whole map
+        map.explore([i for i in changed if fov_visible[i] and not map.explored[i]])
+    else:
+        map.sync_fov(fov_map, fov_changes)
         libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+        previous = fov_visible[:]
+        libtcod.map_get_fov(fov_map, fov_visible)
+        changed = planes.changed(previous, fov_visible)
+        map.explore_visible(fov_visible)
+    return changed
 
-    for y in range(map.h):
-        for x in range(map.w):
-            if (fov):
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-            else:
-                visible = True
-            wall = map.at(x,y).block_sight
-            if not visible:
-                if map.at(x,y).explored or not fov:
-                    if wall:
-                        libtcod.console_put_char_ex(con, x, y, '#', color_dark_wall, libtcod.black)
-                    else:
-                        libtcod.console_put_char_ex(con, x, y, '.', color_dark_ground, libtcod.black)
-            else:
-                map.at(x,y).explored = True
-                if wall:
-                    libtcod.console_put_char_ex(con, x, y, '#', color_light_wall, BACK_COLOR)
-                else:
-                    libtcod.console_put_char_ex(con, x, y, '.', color_light_ground, BACK_COLOR)
+def render_all():
+    global cells_touched, panel_drawn
+    #redraw only the cells whose tile, visibility or objects changed since the last frame
+    everything, dirty = render_changes.take()
+    everything = everything or screen_invalid
+    if fov: dirty.update(update_fov())
+    else: update_fov()
+    if lighting is not None:
+        dirty.update(lighting.update())
+
+    objects = visible_objects()
+    for (x, y) in set(objects) | set(drawn_objects):
+        if objects.get((x, y)) != drawn_objects.get((x, y)):
+            dirty.add(y * map.w + x)
+
+    if everything or len(dirty) * 4 > map.w * map.h:
+        #too much changed; redraw the whole map with bulk fills instead
+        render_map()
+        for ((x, y), (char, rgb)) in objects.items():
+            #keep the (lit) background render_map gave the cell, as render_map_cell does
+            libtcod.console_put_char(con, x, y, char, libtcod.BKGND_NONE)
+            libtcod.console_set_char_foreground(con, x, y, libtcod.Color(*rgb))
+        libtcod.console_blit(con, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
+        cells_touched = map.w * map.h
+    elif dirty:
+        for i in dirty:
+            render_map_cell(i, objects)
+        xs = [i % map.w for i in dirty]
+        ys = [i / map.w for i in dirty]
+        x, y = min(xs), min(ys)
+        libtcod.console_blit(con, x, y, max(xs) - x + 1, max(ys) - y + 1, 0, x, y)
+        cells_touched = len(dirty)
+    else:
+        cells_touched = 0
+    validate_screen(objects)
+
+    #prepare to render the GUI panel, if anything on it changed
+    names = get_names_under_mouse()
+    panel_state = (player.fighter.hp, player.fighter.max_hp, names,
+        [(line, tuple(color)) for (line, color) in game_msgs])
+    if everything or panel_state != panel_drawn:
+        panel_drawn = panel_state
+        libtcod.console_set_default_background(panel, libtcod.black)
+        libtcod.console_clear(panel)
+
+        #show the player's stats
+        render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
+           libtcod.light_red, libtcod.darker_red)
+
+        #display names of objects under the mouse
+        libtcod.console_set_default_foreground(panel, libtcod.light_gray)
+        libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, names)
+
+        #blit the contents of "panel" to the root console
+        libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
+        cells_touched += SCREEN_WIDTH * PANEL_HEIGHT
+
+def invalidate_screen():
+    #the root console was drawn over (menus, fullscreen, FOV toggle): redraw everything next frame
+    global screen_invalid
+    screen_invalid = True
+
+def validate_screen(objects):
+    global screen_invalid, drawn_objects
+    screen_invalid = False
+    drawn_objects = objects
+
+def visible_objects():
+    #{(x, y): (char, (r, g, b))} of the objects to draw, with combat objects on top
+    #(they cant occupy the same square)
+    drawn = {}
     for object in map.objects:
-        if not object.fighter:
-            object.draw(fov_map, fov)
-    for object in map.objects: #combat objects on top
-        if object.fighter: # (they cant occupy the same square)
-            object.draw(fov_map, fov)
-    libtcod.console_blit(con,0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
-    #prepare to render the GUI panel
-    libtcod.console_set_default_background(panel, libtcod.black)
-    libtcod.console_clear(panel)
-
-    #show the player's stats
-    render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
-       libtcod.light_red, libtcod.darker_red)
-
-    #display names of objects under the mouse
-    libtcod.console_set_default_foreground(panel, libtcod.light_gray)
-    libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
-
-    #blit the contents of "panel" to the root console
-    libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
-
+        if not object.fighter and (not fov or in_fov(object.x, object.y)):
+            drawn[(object.x, object.y)] = (object.char, tuple(object.color))
+    for object in map.objects:
+        if object.fighter and (not fov or in_fov(object.x, object.y)):
+            drawn[(object.x, object.y)] = (object.char, tuple(object.color))
+    return drawn
+
+def render_map_cell(i, objects):
+    #draw a single map cell, and the object on it if any, onto con
+    x, y = i % map.w, i / map.w
+    wall = map.block_sight[i]
+    if not fov or fov_visible[i]:
+        if not map.explored[i]:
+            map.explore([i])
+        style = 3 + wall
+    else:
+        style = (1 + wall) if map.explored[i] else 0
+    glyph, fore, back = MAP_CELL_STYLES[style]
+    if lighting is not None and style > 2:
+        fore = libtcod.Color(*lighting.shade_cell(i, fore))
+        back = libtcod.Color(*lighting.shade_cell(i, back))
+    if (x, y) in objects:
+        char, rgb = objects[(x, y)]
+        glyph, fore = char, libtcod.Color(*rgb)
+    libtcod.console_put_char_ex(con, x, y, glyph, fore, back)
+
+# the ways a map cell can be drawn: (glyph, foreground, background), indexed by
+# 0 for unexplored, 1 + wall if explored but out of view and 3 + wall if visible
+MAP_CELL_STYLES = [
+    (' ', libtcod.black, libtcod.black),
+    ('.', color_dark_ground, libtcod.black),
+    ('#', color_dark_wall, libtcod.black),
+    ('.', color_light_ground, BACK_COLOR),
+    ('#', color_light_wall, BACK_COLOR)]
+
+def in_fov(x, y):
+    #whether a cell was in the player's FOV at the last FOV computation
+    return map.in_bounds(x, y) and fov_visible[y * map.w + x] == 1
+
+def fov_mask():
+    #one byte per map cell, set if the cell is in the player's FOV (or everything if FOV is off)
+    if fov:
+        return fov_visible
+    return planes.new_plane(map.w * map.h, 1)
+
+def render_map():
+    #draw every map cell onto con with one bulk call per plane (chars, foreground, background)
+    #instead of one call per cell; con must be the same size as the map
+    visible = fov_mask()
+    map.explore_visible(visible)
+    glyphs = [ord(glyph) for (glyph, fore, back) in MAP_CELL_STYLES]
+    fores = [fore for (glyph, fore, back) in MAP_CELL_STYLES]
+    backs = [back for (glyph, fore, back) in MAP_CELL_STYLES]
+
+    if numpy_available:
+        wall = planes.grid(map.block_sight, map.w) != 0
+        seen = planes.grid(visible, map.w) != 0
+        explored = planes.grid(map.explored, map.w) != 0
+        style = numpy.where(seen, 3 + wall, numpy.where(explored, 1 + wall, 0))
+        channel = lambda colors, c: numpy.array([getattr(col, c) for col in colors])[style]
+        libtcod.console_fill_char(con, numpy.array(glyphs)[style])
+    else:
+        style = [(3 + wall) if seen else ((1 + wall) if known else 0)
+            for (seen, wall, known) in zip(visible, map.block_sight, map.explored)]
+        channel = lambda colors, c: [getattr(colors[s], c) for s in style]
+        libtcod.console_fill_char(con, [glyphs[s] for s in style])
+
+    if lighting is not None:
+        #light the visible cells, one colour channel at a time
+        unlit = channel
+        channel = lambda colors, c: lighting.shade(unlit(colors, c), 'rgb'.index(c), visible)
+    libtcod.console_fill_foreground(con, channel(fores, 'r'), channel(fores, 'g'), channel(fores, 'b'))
+    libtcod.console_fill_background(con, channel(backs, 'r'), channel(backs, 'g'), channel(backs, 'b'))
 
 def create_room(room):
     global map
     #go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            map.at(x,y).blocked = False
-            map.at(x,y).block_sight = False
+    map.carve(room.x1 + 1, room.y1 + 1, room.x2, room.y2)
 
 def create_h_tunnel(x1, x2, y):
     global map
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        map.at(x,y).blocked = False
-        map.at(x,y).block_sight = False
+    map.carve(min(x1, x2), y, max(x1, x2) + 1, y + 1)
 
 def create_v_tunnel(y1, y2, x):
     global map
     #vertical tunnel
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        map.at(x,y).blocked = False
-        map.at(x,y).block_sight = False
+    map.carve(x, min(y1, y2), x + 1, max(y1, y2) + 1)
 
-def place_objects(room):
+def place_objects(room, max_room_monsters=MAX_ROOM_MONSTERS):
     #choose random number of monsters
-    num_monsters = libtcod.random_get_int(0, 0, MAX_ROOM_MONSTERS)
+    num_monsters = libtcod.random_get_int(rng, 0, max_room_monsters)
 
     for i in range(num_monsters):
         #choose random spot for this monster
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
+        x = libtcod.random_get_int(rng, room.x1+1, room.x2-1)
+        y = libtcod.random_get_int(rng, room.y1+1, room.y2-1)
 
         if not is_blocked(x, y,map):
-            if libtcod.random_get_int(0, 0, 100) < 80:  #80% chance of getting an orc
+            if libtcod.random_get_int(rng, 0, 100) < 80:  #80% chance of getting an orc
                 #create an orc
                 fighter_component = Fighter(hp=10, defense=0, power=3, death_function=monster_death)
                 ai_component = BasicMonster()
@@ -640,19 +844,19 @@ def place_objects(room):
                 ai_component = BasicMonster()
                 monster = Object(x, y, 'T', 'troll', libtcod.darker_green, blocks=True, fighter=fighter_component,ai=ai_component)
 
-            map.objects.append(monster)
+            map.add_object(monster)
 
         #choose random number of items
-    num_items = libtcod.random_get_int(0, 0, MAX_ROOM_ITEMS)
+    num_items = libtcod.random_get_int(rng, 0, MAX_ROOM_ITEMS)
 
     for i in range(num_items):
         #choose random spot for this item
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
+        x = libtcod.random_get_int(rng, room.x1+1, room.x2-1)
+        y = libtcod.random_get_int(rng, room.y1+1, room.y2-1)
 
         #only place it if the tile is not blocked
         if not is_blocked(x, y, map):
-            dice = libtcod.random_get_int(0, 0, 100)
+            dice = libtcod.random_get_int(rng, 0, 100)
             if dice < 50:
                 #create a healing potion
                 item_component = Item(use_function=cast_heal)
@@ -669,7 +873,7 @@ def place_objects(room):
                 #create a confuse scroll (15% chance)
                 item_component = Item(use_function=cast_confuse)
                 item = Object(x, y, '?', 'scroll of confusion', libtcod.light_yellow, item=item_component)
-            map.objects.append(item)
+            map.add_object(item)
 
 def cast_lightning():
     #find closest enemy (inside a maximum range) and damage it
@@ -681,6 +885,8 @@ def cast_lightning():
     #zap it!
     message('A lighting bolt strikes the ' + monster.name + ' with a loud thunder! The damage is '
         + str(LIGHTNING_DAMAGE) + ' hit points.', libtcod.light_blue)
+    if lighting is not None:
+        lighting.add(Light(monster.x, monster.y, LIGHTNING_LIGHT_RADIUS, LIGHTNING_COLOR, falloff=2.0, turns=1))
     monster.fighter.take_damage(LIGHTNING_DAMAGE)
 
 
@@ -689,8 +895,8 @@ def closest_monster(max_range):
     closest_enemy = None
     closest_dist = max_range + 1  #start with (slightly more than) maximum range
 
-    for object in map.objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
+    for object in map.index.in_radius(player.x, player.y, max_range + 1):
+        if object.fighter and not object == player and in_fov(object.x, object.y):
                 #calculate distance between this object and the player
             dist = player.distance_to(object)
             if dist < closest_dist:  #it's closer, so remember it
@@ -699,20 +905,16 @@ def closest_monster(max_range):
     return closest_enemy
 
 def is_blocked(x, y, m):
-    #first test the map tile
-    if m.at(x,y).blocked:
-        return True
-
     #edge of screen test
     if (x < 0 or y < 0 or x >= m.w or y >= m.h):
         return True
 
-    #now check for any blocking objects
-    for object in map.objects:
-        if object.blocks and object.x == x and object.y == y:
-            return True
+    #then test the map tile
+    if m.blocked[y * m.w + x]:
+        return True
 
-    return False
+    #now check for any blocking objects
+    return m.index.blocking_at(x, y) is not None
 
 def target_monter(max_range=None):
     #returns a clicked monster inside FOV up to a range, or None if right-clicked
@@ -722,13 +924,15 @@ def target_monter(max_range=None):
             return None
        
         #return the first clicked mosnter, otherwise loop
-        for obj in objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in map.index.at(x, y):
+            if obj.fighter and obj != player:
                 return obj
 
 def target_tile(max_range=None):
     #return the position of a tile left-clicked in player's FOV (optionally in a range), or (None,None) if right-clicked.
     global key, mouse
+    if scripted_input is not None:
+        return scripted_input.next_target()
     while True:
         #render the screen. this erases the inventory and shows the names of objects under the mouse.
         libtcod.console_flush()
@@ -743,7 +947,7 @@ def target_tile(max_range=None):
             return (None, None)  #cancel if the player right-clicked or pressed Escape
 
         #accept the target if the player clicked in FOV, and in case a range is specified, if it's in that range
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+        if (mouse.lbutton_pressed and in_fov(x, y) and
             (max_range is None or player.distance(x, y) <= max_range)):
             return #change me
 
@@ -793,7 +997,7 @@ def monster_death(monster):
     message(monster.name.capitalize() + ' is dead!', libtcod.orange)
     monster.char = '%'
 #   monster.color = libtcod.dark_red
-    monster.blocks = False
+    map.index.set_blocks(monster, False)
     monster.fighter = None
     monster.ai = None
     monster.name = 'remains of ' + monster.name
@@ -802,42 +1006,126 @@ def monster_death(monster):
 #########################################################################
 ###                           Main                                    ###
 #########################################################################
-player_fighter_component = Fighter(hp=30, defense=2, power=5, death_function=player_death)
-player = Object(0,0, '@', 'player', libtcod.white, blocks=True, fighter=player_fighter_component)
-npc_fighter_component = Fighter(hp=30, defense=2, power=5, death_function=monster_death)
-npc = Object(0, 0, '@', 'npc', libtcod.yellow, blocks=True, fighter=npc_fighter_component)
-fov = True
-map = Map(MAP_WIDTH,MAP_HEIGHT)
-map.generate_map()
-fov_map = libtcod.map_new(map.w, map.h)
-fov_recompute = True
-inventory = []
-
-for y in range(map.h):
-    for x in range(map.w):
-        libtcod.map_set_properties(fov_map, x, y, not map.at(x,y).block_sight, not map.at(x,y).blocked)
-
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
-#welcome message
-message('Welcome! Don\'t lose your shoes because its a long walk through the DUNGEON OF HARD STONE FLOORS!', libtcod.red)
-game_state = 'playing'
-
-mouse = libtcod.Mouse()
-key = libtcod.Key()
-while not libtcod.console_is_window_closed():
-    libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)
-    render_all()
+def init_window():
+    #open the game window and load the font; the game logic itself runs without one
+    libtcod.console_set_custom_font('tiles18x18_gs_ro.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_ASCII_INROW, 16, 25 )
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'python/libtcod tutorial', False)
+    libtcod.console_set_keyboard_repeat(80,25)
+    libtcod.sys_set_fps(LIMIT_FPS)
+
+def new_game(seed=None, map_width=MAP_WIDTH, map_height=MAP_HEIGHT,
+             max_rooms=MAX_ROOMS, max_room_monsters=MAX_ROOM_MONSTERS):
+    #set up the player, a fresh map and all the per-game state. A seed makes the game repeatable.
+    global player, npc, map, fov, fov_map, fov_changes, fov_visible, fov_recompute, player_fov, visibility, lighting
+    global render_changes, screen_invalid, drawn_objects, panel_drawn, cells_touched
+    global inventory, game_msgs, game_state, rng, con, panel, chase_map, flee_map, item_map, flow_fields
+    if seed is not None:
+        rng = libtcod.random_new_from_seed(seed)
+    player_fighter_component = Fighter(hp=30, defense=2, power=5, death_function=player_death)
+    player = Object(0,0, '@', 'player', libtcod.white, blocks=True, fighter=player_fighter_component)
+    npc_fighter_component = Fighter(hp=30, defense=2, power=5, death_function=monster_death)
+    npc = Object(0, 0, '@', 'npc', libtcod.yellow, blocks=True, fighter=npc_fighter_component)
+    fov = True
+    if map is not None:
+        map.close()
+    map = Map(map_width, map_height, [npc, player])
+    map.generate_map(max_rooms, max_room_monsters)
+    schedule_monsters()
+    if chase_map is not None:
+        chase_map.close()  #before the fov_map it searches over goes
+    if fov_map is not None:
+        libtcod.map_delete(fov_map)
+    fov_map = libtcod.map_new(map.w, map.h)
+    fov_changes = map.watch()
+    map.sync_fov(fov_map, fov_changes)
+    if player_fov is not None:
+        player_fov.close()
+    fov_engine = engine_for(map, FOV_ALGO, FOV_TABLES)
+    player_fov = fov_engine(map, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+    fov_visible = player_fov.visible if FOV_WINDOWED else planes.new_plane(map.w * map.h)
+    if visibility is not None:
+        visibility.close()
+    visibility = Visibility(map, FOV_LIGHT_WALLS, SIGHT_ALGO)
+    lighting = None
+    if LIGHTING:
+        lighting = Lighting(map, visibility)
+        lighting.add(Light(0, 0, TORCH_RADIUS, TORCH_COLOR, owner=player))
+    fov_recompute = True
+    chase_map = DistanceMap(fov_map, map.w, map.h)
+    flee_map = FleeMap(map, chase_player)
+    item_map = SourceMap(map, lambda: [(obj.x, obj.y) for obj in map.objects if obj.item])
+    if flow_fields is not None:
+        flow_fields.close()
+    flow_fields = FlowFields(map)
+    render_changes = map.watch()
+    screen_invalid = True
+    drawn_objects = {}
+    panel_drawn = None
+    cells_touched = 0  #how many console cells the last frame redrew
+    inventory = []
+
+    if con is None or libtcod.console_get_width(con) != map.w or libtcod.console_get_height(con) != map.h:
+        if con is not None:
+            libtcod.console_delete(con)
+        con = libtcod.console_new(map.w, map.h)
+    if panel is None:
+        panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+    game_msgs = []
+    #welcome message
+    message('Welcome! Don\'t lose your shoes because its a long walk through the DUNGEON OF HARD STONE FLOORS!', libtcod.red)
+    game_state = 'playing'
+
+def chase_player():
+    #the distance map to the player, shared by every chasing monster; it is only
+    #recomputed when the player has moved or the map has changed since the last time
+    if chase_map.root != (player.x, player.y) or chase_map.revision != map.revision:
+        map.sync_fov(fov_map, fov_changes)
+        chase_map.compute(player.x, player.y, map.revision)
+    return chase_map
+
+def schedule_monsters():
+    #queue up every monster on the map; they all start asleep until the player comes near
+    global scheduler
+    scheduler = Scheduler()
+    for object in map.objects:
+        if object.ai:
+            scheduler.add(object, asleep=True)
+
+def monster_turn(monster):
+    if not monster.ai:
+        scheduler.remove(monster)  #dead
+    elif monster.distance_to(player) > WAKE_RADIUS and getattr(monster.ai, 'noise', None) is None:
+        scheduler.sleep(monster)
+    else:
+        monster.ai.take_turn()
+
+def take_monster_turns():
+    #the player's action took its time: wake up the monsters around the player, then
+    #let every awake monster act as often as its speed allows in that time
+    if lighting is not None:
+        lighting.tick()
+    for object in map.index.in_radius(player.x, player.y, WAKE_RADIUS):
+        if object.ai:
+            scheduler.wake(object)
+    scheduler.advance(action_time(player), monster_turn)
+
+def play_game():
+    global key, mouse, player_action
+    mouse = libtcod.Mouse()
+    key = libtcod.Key()
+    while not libtcod.console_is_window_closed():
+        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)
+        render_all()
 
-    libtcod.console_flush()
+        libtcod.console_flush()
 
-    for object in map.objects:
-        object.clear()
-
-    player_action = handle_keys(game_state, key)
-    if player_action == 'exit':
-        break
-    #let monsters take their turn
-    if game_state == 'playing' and player_action != 'didnt-take-turn':
-        for object in map.objects:
-            if object.ai:
-                object.ai.take_turn()
+        player_action = handle_keys(game_state, key)
+        if player_action == 'exit':
+            break
+        if game_state == 'playing' and player_action != 'didnt-take-turn':
+            take_monster_turns()
+
+if __name__ == '__main__':
+    init_window()
+    new_game()
+    play_game()
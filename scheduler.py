@@ -0,0 +1,63 @@
+import heapq
+import itertools
+
+# Time is counted in ticks. An action at normal speed takes TURN_LENGTH ticks, an actor
+# with speed s takes TURN_LENGTH * NORMAL_SPEED / s ticks, so a speed of 200 acts twice a turn.
+NORMAL_SPEED = 100
+TURN_LENGTH = 100
+
+def action_time(actor):
+    return TURN_LENGTH * NORMAL_SPEED / max(1, getattr(actor, 'speed', NORMAL_SPEED))
+
+class Scheduler:
+    #actors queued by the time of their next action, so a turn only costs as much as the
+    #actors that actually act. Actors that can't do anything useful (eg. far from the player)
+    #sleep outside the queue until something wakes them up.
+    def __init__(self):
+        self.time = 0
+        self.queue = []  #(time of next action, sequence number, actor)
+        self.due = {}  #actor -> time of its next action, for every queued actor
+        self.sleeping = set()
+        self.sequence = itertools.count()
+
+    def add(self, actor, asleep=False):
+        if asleep:
+            self.sleeping.add(actor)
+        else:
+            self._push(actor, self.time)
+
+    def _push(self, actor, time):
+        self.due[actor] = time
+        heapq.heappush(self.queue, (time, next(self.sequence), actor))
+
+    def remove(self, actor):
+        #queue entries are dropped lazily, when they come up
+        self.due.pop(actor, None)
+        self.sleeping.discard(actor)
+
+    def sleep(self, actor):
+        if actor in self.due:
+            del self.due[actor]
+            self.sleeping.add(actor)
+
+    def wake(self, actor):
+        if actor in self.sleeping:
+            self.sleeping.remove(actor)
+            self._push(actor, self.time)
+
+    def is_awake(self, actor):
+        return actor in self.due
+
+    def advance(self, duration, act):
+        #let time pass, calling act(actor) for each action that falls due. act may sleep or
+        #remove the actor; otherwise its next action is scheduled after action_time(actor).
+        end = self.time + duration
+        while self.queue and self.queue[0][0] < end:
+            time, sequence, actor = heapq.heappop(self.queue)
+            if self.due.get(actor) != time:
+                continue  #stale entry of a removed, sleeping or rescheduled actor
+            self.time = time
+            act(actor)
+            if self.due.get(actor) == time:
+                self._push(actor, time + action_time(actor))
+        self.time = end
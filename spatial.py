@@ -0,0 +1,78 @@
+import math
+
+# Index of the objects on a map by position, so lookups don't have to scan every object.
+# Objects are bucketed by the cell they stand on, for exact lookups, and by
+# BUCKET_SIZE x BUCKET_SIZE blocks of cells, for radius queries.
+# Whoever moves an object must tell the index (see move), or make it stop blocking (see
+# set_blocks). revision counts the changes to blocking objects, and watchers get the cells
+# they happened on, so results that depend on them can tell they're stale.
+
+BUCKET_SHIFT = 3
+BUCKET_SIZE = 1 << BUCKET_SHIFT
+
+class SpatialIndex:
+    def __init__(self, objects=()):
+        self.cells = {}
+        self.buckets = {}
+        self.revision = 0
+        self.watchers = []
+        for obj in objects:
+            self.add(obj)
+
+    def watch(self):
+        #a set that collects the (x, y) of every change to a blocking object from now on
+        changes = set()
+        self.watchers.append(changes)
+        return changes
+
+    def _blocking_changed(self, x, y):
+        self.revision += 1
+        for changes in self.watchers:
+            changes.add((x, y))
+
+    def add(self, obj):
+        if obj.blocks: self._blocking_changed(obj.x, obj.y)
+        self.cells.setdefault((obj.x, obj.y), []).append(obj)
+        self.buckets.setdefault((obj.x >> BUCKET_SHIFT, obj.y >> BUCKET_SHIFT), []).append(obj)
+
+    def remove(self, obj):
+        self._discard(obj, obj.x, obj.y)
+
+    def move(self, obj, old_x, old_y):
+        #obj has already been moved from (old_x, old_y) to (obj.x, obj.y)
+        self._discard(obj, old_x, old_y)
+        self.add(obj)
+
+    def set_blocks(self, obj, blocks):
+        if obj.blocks != blocks:
+            obj.blocks = blocks
+            self._blocking_changed(obj.x, obj.y)
+
+    def _discard(self, obj, x, y):
+        if obj.blocks: self._blocking_changed(x, y)
+        for table, key in ((self.cells, (x, y)), (self.buckets, (x >> BUCKET_SHIFT, y >> BUCKET_SHIFT))):
+            objs = table[key]
+            objs.remove(obj)
+            if not objs:
+                del table[key]
+
+    def at(self, x, y):
+        #all objects standing on (x, y)
+        return self.cells.get((x, y), ())
+
+    def blocking_at(self, x, y):
+        #the object blocking (x, y), or None
+        for obj in self.cells.get((x, y), ()):
+            if obj.blocks:
+                return obj
+        return None
+
+    def in_radius(self, x, y, radius):
+        #all objects at most radius away from (x, y), euclidean distance
+        found = []
+        for bx in range((x - int(radius)) >> BUCKET_SHIFT, ((x + int(radius)) >> BUCKET_SHIFT) + 1):
+            for by in range((y - int(radius)) >> BUCKET_SHIFT, ((y + int(radius)) >> BUCKET_SHIFT) + 1):
+                for obj in self.buckets.get((bx, by), ()):
+                    if math.sqrt((obj.x - x) ** 2 + (obj.y - y) ** 2) <= radius:
+                        found.append(obj)
+        return found
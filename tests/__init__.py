@@ -0,0 +1 @@
+# Run from the top of the repo, where libtcodpy finds libtcod.so:  python -m unittest discover tests
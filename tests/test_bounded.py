@@ -0,0 +1,53 @@
+import unittest
+import random
+import pyRL
+import paths
+import bounded
+from geometry import Pos
+
+def route_cost(costs, w, start, route):
+    #what a route costs, the way bounded.find_path counts it
+    total, x, y = 0, start.x, start.y
+    for xy in route:
+        total += costs[xy.y * w + xy.x] * (bounded.DIAGONAL_COST if xy.x != x and xy.y != y else 1)
+        x, y = xy.x, xy.y
+    return total
+
+class BoundedTest(unittest.TestCase):
+    def setUp(self):
+        pyRL.new_game(1, 60, 40, 20, 3)
+        self.map = pyRL.map
+        self.rng = random.Random(1)
+
+    def floor(self, count):
+        m = self.map
+        cells = [i for i in range(m.w * m.h) if not m.blocked[i]]
+        return [Pos(i % m.w, i / m.w) for i in self.rng.sample(cells, count)]
+
+    def test_bounded_search_respects_its_cutoff(self):
+        m = self.map
+        costs = m.cost_planes.plane(False, False, False)
+        for (start, goal) in zip(self.floor(30), self.floor(30)):
+            goal_cost = costs[goal.y * m.w + goal.x]
+            best = bounded.find_path(costs, m.w, m.h, start, goal, goal_cost, m.w * m.h * 2)
+            if not best:
+                continue
+            cost = route_cost(costs, m.w, start, best)
+            below = bounded.find_path(costs, m.w, m.h, start, goal, goal_cost, cost - 0.5)
+            self.assertEqual(below, [])
+            within = bounded.find_path(costs, m.w, m.h, start, goal, goal_cost, cost)
+            self.assertEqual(within[-1], goal)
+            self.assertAlmostEqual(route_cost(costs, m.w, start, within), cost)
+
+    def test_towards_gives_the_same_answer_with_a_cached_route(self):
+        m = self.map
+        m.fill(False)
+        start, goal = Pos(10, 10), Pos(30, 30)  #20 diagonal steps, costing 28.2
+        for cached in (False, True):
+            if cached:
+                paths.towards(m, start, goal, consider_unexplored_blocked=False)
+            self.assertIsNone(paths.towards(m, start, goal, consider_unexplored_blocked=False, max_distance=25))
+            self.assertIsNotNone(paths.towards(m, start, goal, consider_unexplored_blocked=False, max_distance=29))
+
+if __name__ == '__main__':
+    unittest.main()
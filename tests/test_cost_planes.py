@@ -0,0 +1,41 @@
+import unittest
+import random
+import itertools
+import pyRL
+from geometry import Pos
+
+class CostPlanesTest(unittest.TestCase):
+    def setUp(self):
+        pyRL.new_game(1, 60, 40, 20, 3)
+        self.map = pyRL.map
+        self.rng = random.Random(1)
+
+    def floor(self, count):
+        m = self.map
+        cells = [i for i in range(m.w * m.h) if not m.blocked[i]]
+        return [Pos(i % m.w, i / m.w) for i in self.rng.sample(cells, count)]
+
+    def test_cost_planes_match_a_rebuild(self):
+        m, rng = self.map, self.rng
+        every_flags = list(itertools.product((False, True), repeat=3))
+        for flags in every_flags:
+            m.cost_planes.plane(*flags)
+        movers = [obj for obj in m.objects if obj.blocks]
+        for edit in range(50):
+            x, y = rng.randrange(1, m.w - 1), rng.randrange(1, m.h - 1)
+            m.set_tile(x, y, rng.random() < 0.5)
+            m.explore([rng.randrange(m.w * m.h) for i in range(10)])
+            tile = m.at(rng.randrange(1, m.w - 1), rng.randrange(1, m.h - 1))
+            tile.blocked = not tile.blocked
+            tile = m.at(rng.randrange(m.w), rng.randrange(m.h))
+            tile.explored = not tile.explored
+            obj = rng.choice(movers)
+            to = self.floor(1)[0]
+            if not m.index.blocking_at(to.x, to.y):
+                m.place_object(obj, to.x, to.y)
+            if edit % 10 == 9:
+                for flags in every_flags:
+                    self.assertEqual(m.cost_planes.plane(*flags), m.cost_planes._build(flags), flags)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+import array
+import random
+import libtcodpy as libtcod
+import planes
+from tilemap import TileMap
+from distmap import DistanceMap, SourceMap, FleeMap, relax, UNREACHABLE, NEIGHBOURS, FAR, \
+    STRAIGHT, DIAGONAL, FLEE_RADIUS, FLEE_SCALE, SOURCE_RANGE
+
+def settle(values, walkable, w, h):
+    #relax's answer the slow way: improve every cell from its neighbours until none changes
+    values = list(values)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(w * h):
+            if not walkable[i]:
+                values[i] = FAR
+                continue
+            x, y = i % w, i / w
+            for (dx, dy) in NEIGHBOURS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < w and 0 <= ny < h and walkable[ny * w + nx] and values[ny * w + nx] != FAR:
+                    value = values[ny * w + nx] + (DIAGONAL if dx and dy else STRAIGHT)
+                    if value < values[i]:
+                        values[i], changed = value, True
+    return values
+
+def random_level(seed, w=40, h=30):
+    rng = random.Random(seed)
+    level = TileMap(w, h)
+    level.carve(1, 1, w - 1, h - 1)
+    for k in range(w * h / 5):
+        level.set_tile(rng.randrange(1, w - 1), rng.randrange(1, h - 1), True)
+    return level, rng
+
+class DistanceMapTest(unittest.TestCase):
+    def setUp(self):
+        self.level, self.rng = random_level(1)
+        self.walk_map = libtcod.map_new(self.level.w, self.level.h)
+        self.level.sync_fov(self.walk_map, self.level.watch())
+        self.distance_map = DistanceMap(self.walk_map, self.level.w, self.level.h)
+
+    def tearDown(self):
+        self.distance_map.close()
+        libtcod.map_delete(self.walk_map)
+
+    def floor(self):
+        level = self.level
+        while True:
+            x, y = self.rng.randrange(level.w), self.rng.randrange(level.h)
+            if not level.blocked[y * level.w + x]:
+                return x, y
+
+    def test_distances_match_libtcod(self):
+        level, d = self.level, self.distance_map
+        d.compute(*self.floor())
+        self.assertEqual(list(libtcod.dijkstra_get_distances(d.dijkstra, array.array('I', [0]) * (level.w * level.h))),
+                         list(d.distances))
+        for y in range(level.h):
+            for x in range(level.w):
+                expected = libtcod.dijkstra_get_distance(d.dijkstra, x, y)
+                if expected < 0:
+                    self.assertEqual(d.distance(x, y), UNREACHABLE)
+                else:
+                    self.assertAlmostEqual(d.distance(x, y) / 100.0, expected, places=3)
+
+    def test_walking_downhill_reaches_the_root(self):
+        level, d = self.level, self.distance_map
+        d.compute(*self.floor())
+        for k in range(20):
+            x, y = self.floor()
+            if d.distance(x, y) == UNREACHABLE:
+                continue
+            steps = 0
+            while (x, y) != d.root:
+                step = d.downhill(x, y)
+                self.assertIn(step, NEIGHBOURS)
+                self.assertTrue(d.distance(x + step[0], y + step[1]) < d.distance(x, y))
+                x, y = x + step[0], y + step[1]
+                steps += 1
+            self.assertTrue(steps <= level.w * level.h)
+            self.assertIsNone(d.downhill(x, y))
+
+    def test_a_cut_off_root_leaves_the_rest_unreachable(self):
+        #compute in a big room, then from a closet walled off from it
+        level = TileMap(30, 20)
+        level.carve(1, 1, 20, 19)
+        level.carve(24, 1, 29, 5)
+        walk_map = libtcod.map_new(level.w, level.h)
+        level.sync_fov(walk_map, level.watch())
+        d = DistanceMap(walk_map, level.w, level.h)
+        try:
+            d.compute(10, 10)
+            d.compute(26, 3)
+            for y in range(level.h):
+                for x in range(level.w):
+                    if x < 24:
+                        self.assertEqual(d.distance(x, y), UNREACHABLE, (x, y))
+                    elif not level.blocked[y * level.w + x]:
+                        self.assertNotEqual(d.distance(x, y), UNREACHABLE, (x, y))
+        finally:
+            d.close()
+            libtcod.map_delete(walk_map)
+
+class RelaxTest(unittest.TestCase):
+    def setUp(self):
+        self.level, self.rng = random_level(2)
+        self.walkable = bytearray(planes.negate(self.level.blocked))
+
+    def test_relax_settles_any_starting_values(self):
+        level, rng = self.level, self.rng
+        values = planes.new_plane(level.w * level.h, FAR, 'i')
+        for k in range(10):
+            values[rng.randrange(level.w * level.h)] = rng.randint(-3000, 3000)
+        expected = settle(values, self.walkable, level.w, level.h)
+        relax(values, self.walkable, level.w, level.h)
+        self.assertEqual(list(values), expected)
+
+    def test_relax_leaves_values_over_the_limit_far(self):
+        #a corridor with the root at one end and a start of 900 at the other: every cell
+        #it could improve is nearer the root, so only the limit can clear it
+        values = planes.new_plane(20, FAR, 'i')
+        values[0], values[19] = 0, 900
+        relax(values, bytearray([1]) * 20, 20, 1, 700)
+        self.assertEqual(list(values), [i * STRAIGHT if i * STRAIGHT <= 700 else FAR for i in range(20)])
+
+    def test_source_map_reaches_source_range(self):
+        level = TileMap(120, 3)
+        level.carve(0, 0, 120, 3)
+        sources = SourceMap(level, lambda: [(0, 1)]).update()
+        self.assertEqual(sources.distance(10, 1), 10 * STRAIGHT)
+        self.assertEqual(sources.distance(SOURCE_RANGE / STRAIGHT, 1), SOURCE_RANGE)
+        self.assertEqual(sources.distance(SOURCE_RANGE / STRAIGHT + 1, 1), FAR)
+
+class FleeMapTest(unittest.TestCase):
+    def setUp(self):
+        self.level, self.rng = random_level(3, 70, 50)
+        self.level.set_tile(35, 25, False)
+        self.walk_map = libtcod.map_new(self.level.w, self.level.h)
+        self.level.sync_fov(self.walk_map, self.level.watch())
+        self.chase = DistanceMap(self.walk_map, self.level.w, self.level.h)
+        self.chase.compute(35, 25)
+
+    def tearDown(self):
+        self.chase.close()
+        libtcod.map_delete(self.walk_map)
+
+    def test_flee_map_covers_the_window_around_the_root(self):
+        level, r = self.level, FLEE_RADIUS
+        flee = FleeMap(level, lambda: self.chase).update()
+        x0, y0, x1, y1 = 35 - r, 25 - r, 35 + r + 1, 25 + r + 1
+        ww, wh = x1 - x0, y1 - y0
+        window = [FAR if distance == UNREACHABLE else int(distance * FLEE_SCALE)
+                  for y in range(y0, y1) for distance in self.chase.distances[y * level.w + x0:y * level.w + x1]]
+        walkable = [not level.blocked[y * level.w + x] for y in range(y0, y1) for x in range(x0, x1)]
+        expected = settle(window, walkable, ww, wh)
+        for y in range(level.h):
+            for x in range(level.w):
+                if x0 <= x < x1 and y0 <= y < y1:
+                    self.assertEqual(flee.distance(x, y), expected[(y - y0) * ww + x - x0], (x, y))
+                else:
+                    self.assertEqual(flee.distance(x, y), FAR, (x, y))
+
+if __name__ == '__main__':
+    unittest.main()
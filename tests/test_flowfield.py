@@ -0,0 +1,71 @@
+import unittest
+import random
+from tilemap import TileMap
+from distmap import UNREACHABLE
+from flowfield import FlowFields
+
+class FlowFieldTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(1)
+        self.level = TileMap(40, 30)
+        self.level.carve(1, 1, 39, 29)
+        for k in range(200):
+            self.level.set_tile(self.rng.randrange(1, 39), self.rng.randrange(1, 29), True)
+        self.fields = FlowFields(self.level)
+
+    def tearDown(self):
+        self.fields.close()
+
+    def floor(self):
+        level = self.level
+        while True:
+            x, y = self.rng.randrange(level.w), self.rng.randrange(level.h)
+            if not level.blocked[y * level.w + x]:
+                return x, y
+
+    def test_following_the_field_reaches_the_goal(self):
+        goal = self.floor()
+        field = self.fields.towards(*goal)
+        self.assertIsNone(field.step(*goal))
+        for k in range(30):
+            x, y = self.floor()
+            if field.distances[y * self.level.w + x] == UNREACHABLE:
+                self.assertIsNone(field.step(x, y))
+                continue
+            for steps in range(self.level.w * self.level.h):
+                step = field.step(x, y)
+                if step is None:
+                    break
+                x, y = x + step[0], y + step[1]
+                self.assertFalse(self.level.blocked[y * self.level.w + x])
+            self.assertEqual((x, y), goal)
+
+    def test_a_blocked_best_step_falls_back_to_one_that_still_gets_closer(self):
+        goal = self.floor()
+        field = self.fields.towards(*goal)
+        w = self.level.w
+        for k in range(30):
+            x, y = self.floor()
+            best = field.step(x, y)
+            if best is None:
+                continue
+            taken = (x + best[0], y + best[1])
+            step = field.step(x, y, lambda bx, by: (bx, by) == taken)
+            if step is not None:
+                self.assertNotEqual(step, best)
+                self.assertTrue(field.distances[(y + step[1]) * w + x + step[0]] < field.distances[y * w + x])
+
+    def test_fields_are_shared_until_a_tile_changes(self):
+        goal = self.floor()
+        field = self.fields.towards(*goal)
+        self.assertIs(self.fields.towards(*goal), field)
+        x, y = goal
+        while (x, y) == goal:
+            x, y = self.floor()
+        self.level.set_tile(x, y, True)
+        changed = self.fields.towards(*goal)
+        self.assertIsNot(changed, field)
+        self.assertEqual(changed.distances[y * self.level.w + x], UNREACHABLE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import random
+import pyRL
+import libtcodpy as libtcod
+from fov import WindowedFov, ShadowcastFov, MapFov, WINDOW_ALGOS, engine_for
+
+class FovTest(unittest.TestCase):
+    def setUp(self):
+        pyRL.new_game(1, 60, 40, 20, 0)
+        self.map = pyRL.map
+        m = self.map
+        cells = [i for i in range(m.w * m.h) if not m.blocked[i]]
+        self.viewers = [(i % m.w, i / m.w) for i in random.Random(1).sample(cells, 50)]
+
+    def test_windowed_fov_matches_the_whole_map(self):
+        for algo in WINDOW_ALGOS:
+            windowed = WindowedFov(self.map, pyRL.TORCH_RADIUS, True, algo)
+            whole = MapFov(self.map, pyRL.TORCH_RADIUS, True, algo)
+            for (x, y) in self.viewers:
+                self.assertEqual(windowed.lit_from(x, y), whole.lit_from(x, y), (algo, x, y))
+            windowed.close()
+            whole.close()
+        for light_walls in (True, False):
+            tables = ShadowcastFov(self.map, pyRL.TORCH_RADIUS, light_walls)
+            whole = MapFov(self.map, pyRL.TORCH_RADIUS, light_walls, libtcod.FOV_SHADOW)
+            for (x, y) in self.viewers:
+                self.assertEqual(tables.lit_from(x, y), whole.lit_from(x, y), ('tables', light_walls, x, y))
+            whole.close()
+
+    def test_fov_rect_reads_the_same_flags_as_the_whole_map(self):
+        fov = MapFov(self.map, pyRL.TORCH_RADIUS)
+        w = self.map.w
+        for (x, y) in self.viewers[:10]:
+            fov.lit_from(x, y)
+            whole = libtcod.map_get_fov(fov.fov_map)
+            x0, y0, x1, y1 = max(0, x - 12), max(0, y - 8), min(w, x + 5), min(self.map.h, y + 9)
+            rect = libtcod.map_get_fov_rect(fov.fov_map, x0, y0, x1, y1)
+            self.assertEqual(rect, ''.join(str(whole[wy * w + x0:wy * w + x1]) for wy in range(y0, y1)))
+        fov.close()
+
+    def test_compute_reports_the_changed_cells(self):
+        fov = MapFov(self.map, pyRL.TORCH_RADIUS)
+        before = set()
+        for (x, y) in self.viewers[:10]:
+            changed = fov.compute(x, y)
+            self.assertEqual(changed, before ^ fov.lit)
+            self.assertEqual(set(i for (i, v) in enumerate(fov.visible) if v), fov.lit)
+            before = fov.lit
+        fov.close()
+
+    def test_algorithms_that_window_differently_use_the_whole_map(self):
+        self.assertRaises(ValueError, WindowedFov, self.map, pyRL.TORCH_RADIUS, True, 0)
+        self.assertIs(engine_for(self.map, 0), MapFov)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import array
+import random
+import libtcodpy as libtcod
+
+class FovExportTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.w, self.h = 40, 25
+        self.fov_map = libtcod.map_new(self.w, self.h)
+        for y in range(self.h):
+            for x in range(self.w):
+                libtcod.map_set_properties(self.fov_map, x, y, rng.random() < 0.8, rng.random() < 0.7)
+        libtcod.map_compute_fov(self.fov_map, 20, 12, 10, True, libtcod.FOV_SHADOW)
+
+    def tearDown(self):
+        libtcod.map_delete(self.fov_map)
+
+    def each_cell(self, is_set):
+        return [int(bool(is_set(self.fov_map, x, y))) for y in range(self.h) for x in range(self.w)]
+
+    def test_flags_match_the_cell_by_cell_queries(self):
+        for (get, is_set) in ((libtcod.map_get_fov, libtcod.map_is_in_fov),
+                              (libtcod.map_get_transparent, libtcod.map_is_transparent),
+                              (libtcod.map_get_walkable, libtcod.map_is_walkable)):
+            expected = self.each_cell(is_set)
+            self.assertEqual(list(get(self.fov_map)), expected)
+            out = array.array('B', [7]) * (self.w * self.h)
+            self.assertIs(get(self.fov_map, out), out)
+            self.assertEqual(list(out), expected)
+
+    def test_out_of_the_wrong_size_is_rejected(self):
+        self.assertRaises(TypeError, libtcod.map_get_fov, self.fov_map, array.array('B', [0]) * 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import random
+import libtcodpy as libtcod
+from tilemap import TileMap
+
+def properties(fov_map, w, h):
+    #(transparent, walkable) of every cell, asked one cell at a time
+    return [(bool(libtcod.map_is_transparent(fov_map, x, y)), bool(libtcod.map_is_walkable(fov_map, x, y)))
+            for y in range(h) for x in range(w)]
+
+class FovSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(1)
+        self.map = TileMap(30, 20)
+        self.map.carve(1, 1, 29, 19)
+        self.fov_map = libtcod.map_new(30, 20)
+
+    def tearDown(self):
+        libtcod.map_delete(self.fov_map)
+
+    def expected(self):
+        m = self.map
+        return [(not m.block_sight[i], not m.blocked[i]) for i in range(m.w * m.h)]
+
+    def test_bulk_set_matches_cell_by_cell(self):
+        w, h, rng = 30, 20, self.rng
+        transparent = bytearray(rng.randint(0, 1) for i in range(w * h))
+        walkable = bytearray(rng.randint(0, 1) for i in range(w * h))
+        libtcod.map_set_properties_bulk(self.fov_map, transparent, walkable)
+        one_by_one = libtcod.map_new(w, h)
+        for i in range(w * h):
+            libtcod.map_set_properties(one_by_one, i % w, i / w, transparent[i], walkable[i])
+        self.assertEqual(properties(self.fov_map, w, h), properties(one_by_one, w, h))
+        libtcod.map_delete(one_by_one)
+
+    def test_bulk_set_rejects_the_wrong_size(self):
+        self.assertRaises(TypeError, libtcod.map_set_properties_bulk, self.fov_map, '\1' * 10, '\1' * 10)
+
+    def test_sync_follows_tile_changes(self):
+        m, rng = self.map, self.rng
+        changes = m.watch()
+        m.sync_fov(self.fov_map, changes)
+        self.assertEqual(properties(self.fov_map, m.w, m.h), self.expected())
+        for edits in (1, 5, 200):  #a few cells at a time, then enough for a bulk copy
+            for edit in range(edits):
+                x, y = rng.randrange(m.w), rng.randrange(m.h)
+                if rng.random() < 0.5:
+                    m.set_tile(x, y, rng.random() < 0.5)
+                else:
+                    m.at(x, y).block_sight = rng.random() < 0.5
+            m.sync_fov(self.fov_map, changes)
+            self.assertEqual(properties(self.fov_map, m.w, m.h), self.expected(), edits)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import heapq
+import random
+from geometry import Pos
+from jps import JumpPointSearch, DIAGONAL_COST
+
+def shortest(walk, w, h, start, goal):
+    #the cost of the cheapest route by a plain dijkstra over every cell, None if none
+    costs, queue = {start: 0}, [(0, start)]
+    while queue:
+        cost, (x, y) = heapq.heappop(queue)
+        if (x, y) == goal:
+            return cost
+        if cost > costs[(x, y)]:
+            continue
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nx, ny = x + dx, y + dy
+                if (dx or dy) and 0 <= nx < w and 0 <= ny < h and walk[ny * w + nx]:
+                    new_cost = cost + (DIAGONAL_COST if dx and dy else 1)
+                    if new_cost < costs.get((nx, ny), new_cost + 1):
+                        costs[(nx, ny)] = new_cost
+                        heapq.heappush(queue, (new_cost, (nx, ny)))
+    return None
+
+class JumpPointSearchTest(unittest.TestCase):
+    def test_routes_cost_the_same_as_dijkstra(self):
+        rng = random.Random(1)
+        for trial in range(40):
+            w, h = rng.randint(5, 40), rng.randint(5, 30)
+            walk = bytearray(int(rng.random() > 0.3) for i in range(w * h))
+            search = JumpPointSearch(walk, w, h)
+            for k in range(5):
+                start = (rng.randrange(w), rng.randrange(h))
+                goal = (rng.randrange(w), rng.randrange(h))
+                walk[start[1] * w + start[0]] = 1
+                route = search.find_path(Pos(*start), Pos(*goal))
+                best = shortest(walk, w, h, start, goal) if start != goal else None
+                if best is None or start == goal:
+                    self.assertEqual(route, [])
+                    continue
+                self.assertEqual((route[-1].x, route[-1].y), goal)
+                cost, (x, y) = 0, start
+                for cell in route:
+                    self.assertTrue(max(abs(cell.x - x), abs(cell.y - y)) == 1 and walk[cell.y * w + cell.x])
+                    cost += DIAGONAL_COST if cell.x != x and cell.y != y else 1
+                    x, y = cell.x, cell.y
+                self.assertAlmostEqual(cost, best)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import random
+from tilemap import TileMap
+from fov import Visibility
+from lighting import Lighting, Light, AMBIENT
+
+class Walker(object):
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+class LightingTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(1)
+        self.level = TileMap(40, 30)
+        self.level.carve(1, 1, 39, 29)
+        for k in range(150):
+            self.level.set_tile(self.rng.randrange(1, 39), self.rng.randrange(1, 29), True)
+        self.lighting = Lighting(self.level, Visibility(self.level))
+
+    def assertPlanesAlmostEqual(self, lighting, expected):
+        for (plane, other) in zip(lighting.planes, expected.planes):
+            for i in range(len(plane)):
+                self.assertAlmostEqual(plane[i], other[i], places=4)
+
+    def fresh(self, lights):
+        #the planes lit from scratch with lights where they are now
+        lighting = Lighting(self.level, Visibility(self.level))
+        for light in lights:
+            x, y = light.position()
+            lighting.add(Light(x, y, light.radius, light.color, light.falloff))
+        lighting.update()
+        return lighting
+
+    def test_kept_planes_match_lighting_afresh(self):
+        walker = Walker(10, 10)
+        lights = [self.lighting.add(Light(0, 0, 6, (255, 160, 60), owner=walker)),
+                  self.lighting.add(Light(30, 20, 4, (40, 80, 255), falloff=2.0)),
+                  self.lighting.add(Light(20, 15, 8, (255, 255, 255), falloff=0.5))]
+        self.lighting.update()
+        for turn in range(10):
+            walker.x = min(38, max(1, walker.x + self.rng.randint(-1, 1)))
+            walker.y = min(28, max(1, walker.y + self.rng.randint(-1, 1)))
+            for k in range(3):
+                self.level.set_tile(self.rng.randrange(1, 39), self.rng.randrange(1, 29), self.rng.random() < 0.5)
+            self.lighting.update()
+            self.assertPlanesAlmostEqual(self.lighting, self.fresh(lights))
+
+    def test_lights_go_out_when_their_time_is_up(self):
+        self.lighting.add(Light(20, 15, 5, (255, 100, 0), turns=2))
+        self.lighting.update()
+        self.assertTrue(self.lighting.planes[0][15 * 40 + 20] > 0.9)
+        for turn in range(3):
+            self.lighting.tick()
+            self.lighting.update()
+        self.assertEqual(self.lighting.lights, [])
+        for plane in self.lighting.planes:
+            for value in plane:
+                self.assertAlmostEqual(value, 0.0, places=4)
+
+    def test_an_unlit_cell_is_shaded_with_the_ambient_light(self):
+        self.lighting.update()
+        self.assertEqual(self.lighting.shade_cell(5 * 40 + 5, (200, 100, 0)),
+                         (int(200 * AMBIENT), int(100 * AMBIENT), 0))
+
+if __name__ == '__main__':
+    unittest.main()
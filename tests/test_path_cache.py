@@ -0,0 +1,36 @@
+import unittest
+import random
+import pyRL
+import paths
+from geometry import Pos
+
+class PathCacheTest(unittest.TestCase):
+    def setUp(self):
+        pyRL.new_game(1, 60, 40, 20, 3)
+        self.map = pyRL.map
+        self.rng = random.Random(1)
+
+    def floor(self, count):
+        m = self.map
+        cells = [i for i in range(m.w * m.h) if not m.blocked[i]]
+        return [Pos(i % m.w, i / m.w) for i in self.rng.sample(cells, count)]
+
+    def test_path_cache_drops_routes_over_changed_tiles(self):
+        m = self.map
+        for (start, goal) in zip(self.floor(20), self.floor(20)):
+            key = (start.x, start.y, goal.x, goal.y, False, False, False)
+            step = paths.towards(m, start, goal, consider_unexplored_blocked=False)
+            route = m.path_cache.get(key)
+            if step is None or len(route) < 3:
+                continue
+            wall = route[len(route) / 2]
+            m.set_tile(wall.x, wall.y, True)
+            self.assertIsNone(m.path_cache.get(key))
+            paths.towards(m, start, goal, consider_unexplored_blocked=False)
+            route = m.path_cache.get(key)
+            if route is not None:
+                self.assertNotIn(wall, route)
+            m.set_tile(wall.x, wall.y, False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import random
+import planes
+from tilemap import TileMap
+
+class PlanesTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(1)
+
+    def random_plane(self, size, chance=0.3):
+        return planes.from_values([int(self.rng.random() < chance) for i in range(size)])
+
+    def test_pack_round_trips_any_size(self):
+        for size in (0, 1, 7, 8, 9, 63, 100, 1001):
+            plane = self.random_plane(size)
+            data = planes.pack(plane)
+            self.assertEqual(len(data), (size + 7) / 8)
+            self.assertEqual(planes.unpack(data, size), plane)
+
+    def test_pack_puts_the_first_cell_in_the_high_bit(self):
+        self.assertEqual(planes.pack(planes.from_values([1, 0, 0, 0, 0, 0, 0, 0])), '\x80')
+        self.assertEqual(planes.pack(planes.from_values([0, 0, 0, 0, 0, 0, 0, 1, 1])), '\x01\x80')
+
+    def test_merge_returns_the_newly_set_indices(self):
+        plane, mask = self.random_plane(500), self.random_plane(500)
+        expected = [i for i in range(500) if mask[i] and not plane[i]]
+        merged = [int(a or b) for (a, b) in zip(plane, mask)]
+        self.assertEqual(planes.merge(plane, mask), expected)
+        self.assertEqual(list(plane), merged)
+        self.assertEqual(planes.merge(plane, mask), [])
+
+class ExploredTest(unittest.TestCase):
+    def setUp(self):
+        self.level = TileMap(30, 20)
+        self.changes = self.level.watch_explored()
+        self.changes.take()
+        self.visible = planes.new_plane(30 * 20)
+        planes.fill(self.visible, 45, 55, 1)
+
+    def test_explore_visible_tells_the_watchers(self):
+        self.assertEqual(self.level.explore_visible(self.visible), range(45, 55))
+        self.assertEqual(self.changes.take(), (False, set(range(45, 55))))
+        self.assertEqual(self.level.explore_visible(self.visible), [])
+        self.assertEqual(self.changes.take(), (False, set()))
+
+    def test_explored_survives_a_pack(self):
+        self.level.explore_visible(self.visible)
+        data = self.level.pack_explored()
+        restored = TileMap(30, 20)
+        changes = restored.watch_explored()
+        changes.take()
+        restored.unpack_explored(data)
+        self.assertEqual(restored.explored, self.level.explored)
+        self.assertTrue(changes.take()[0])
+
+if __name__ == '__main__':
+    unittest.main()
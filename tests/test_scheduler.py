@@ -0,0 +1,53 @@
+import unittest
+from scheduler import Scheduler, TURN_LENGTH, NORMAL_SPEED
+
+class Actor(object):
+    def __init__(self, name, speed=NORMAL_SPEED):
+        self.name = name
+        self.speed = speed
+
+class SchedulerTest(unittest.TestCase):
+    def run_turns(self, scheduler, turns, act=None):
+        acted = []
+        def record(actor):
+            acted.append(actor.name)
+            if act is not None:
+                act(actor)
+        for turn in range(turns):
+            scheduler.advance(TURN_LENGTH, record)
+        return acted
+
+    def test_actors_act_in_the_order_they_were_added(self):
+        scheduler = Scheduler()
+        for name in 'abc':
+            scheduler.add(Actor(name))
+        self.assertEqual(self.run_turns(scheduler, 2), list('abcabc'))
+
+    def test_faster_actors_act_more_often(self):
+        scheduler = Scheduler()
+        scheduler.add(Actor('slow', NORMAL_SPEED / 2))
+        scheduler.add(Actor('fast', NORMAL_SPEED * 2))
+        acted = self.run_turns(scheduler, 2)
+        self.assertEqual(acted, ['slow', 'fast', 'fast', 'fast', 'fast'])
+
+    def test_sleeping_and_removed_actors_do_not_act(self):
+        scheduler = Scheduler()
+        a, b, c = Actor('a'), Actor('b'), Actor('c')
+        scheduler.add(a)
+        scheduler.add(b)
+        scheduler.add(c, asleep=True)
+        scheduler.remove(b)
+        self.assertEqual(self.run_turns(scheduler, 1), ['a'])
+        scheduler.sleep(a)
+        scheduler.wake(c)
+        self.assertEqual(self.run_turns(scheduler, 1), ['c'])
+        self.assertFalse(scheduler.is_awake(a))
+
+    def test_an_actor_can_sleep_itself(self):
+        scheduler = Scheduler()
+        scheduler.add(Actor('a'))
+        acted = self.run_turns(scheduler, 3, scheduler.sleep)
+        self.assertEqual(acted, ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import math
+import random
+from spatial import SpatialIndex
+
+class Thing(object):
+    def __init__(self, x, y, blocks=False):
+        self.x, self.y, self.blocks = x, y, blocks
+
+class SpatialIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(1)
+        self.things = [Thing(self.rng.randrange(50), self.rng.randrange(40), self.rng.random() < 0.5)
+                       for i in range(200)]
+        self.index = SpatialIndex(self.things)
+
+    def wander(self):
+        #move every thing a little, telling the index
+        for thing in self.things:
+            old_x, old_y = thing.x, thing.y
+            thing.x = min(49, max(0, thing.x + self.rng.randint(-3, 3)))
+            thing.y = min(39, max(0, thing.y + self.rng.randint(-3, 3)))
+            self.index.move(thing, old_x, old_y)
+
+    def check_lookups(self):
+        for y in range(40):
+            for x in range(50):
+                here = [thing for thing in self.things if (thing.x, thing.y) == (x, y)]
+                self.assertEqual(sorted(self.index.at(x, y)), sorted(here))
+                blocker = self.index.blocking_at(x, y)
+                self.assertEqual(blocker is not None, any(thing.blocks for thing in here))
+        for k in range(30):
+            x, y, radius = self.rng.randrange(50), self.rng.randrange(40), self.rng.random() * 12
+            near = [thing for thing in self.things if math.sqrt((thing.x - x) ** 2 + (thing.y - y) ** 2) <= radius]
+            self.assertEqual(sorted(self.index.in_radius(x, y, radius)), sorted(near))
+
+    def test_lookups_match_a_scan(self):
+        self.check_lookups()
+        self.wander()
+        self.check_lookups()
+        for thing in self.things[::3]:
+            self.index.remove(thing)
+        self.things = [thing for (i, thing) in enumerate(self.things) if i % 3]
+        self.check_lookups()
+
+    def test_watchers_see_blocking_changes_only(self):
+        changes = self.index.watch()
+        revision = self.index.revision
+        walker, blocker = Thing(1, 1), Thing(5, 5, True)
+        self.index.add(walker)
+        self.assertEqual((changes, self.index.revision), (set(), revision))
+        self.index.add(blocker)
+        blocker.x = 6
+        self.index.move(blocker, 5, 5)
+        self.assertEqual(changes, set([(5, 5), (6, 5)]))
+        changes.clear()
+        self.index.set_blocks(blocker, False)
+        self.assertEqual(changes, set([(6, 5)]))
+        self.assertIsNone(self.index.blocking_at(6, 5))
+        self.assertTrue(self.index.revision > revision)
+
+if __name__ == '__main__':
+    unittest.main()
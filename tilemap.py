@@ -0,0 +1,196 @@
+import libtcodpy as libtcod
+import planes
+
+# Tile types. Blocked tiles are WALL (permanent) or DIGGABLE rock, open ones FLOOR.
+FLOOR = 0
+WALL = 1
+DIGGABLE = 2
+
+#########################################################################
+###                         Tile View                                 ###
+#########################################################################
+
+class Tile(object):
+    #a view of a single cell of a TileMap. It holds no state of its own:
+    #reading or writing a property goes straight to the map's planes.
+    __slots__ = ('map', 'i')
+
+    def __init__(self, map, i):
+        self.map = map
+        self.i = i
+
+    def _get_blocked(self):
+        return bool(self.map.blocked[self.i])
+    def _set_blocked(self, blocked):
+        #the type follows, as with set_tile: an opened tile becomes FLOOR and a
+        #closed one DIGGABLE, while a tile that stays blocked keeps its type (eg. WALL)
+        if not blocked:
+            self.map.type[self.i] = FLOOR
+        elif not self.map.blocked[self.i]:
+            self.map.type[self.i] = DIGGABLE
+        self.map.blocked[self.i] = blocked
+        self.map.touch(self.i)
+
+    def _get_block_sight(self):
+        return bool(self.map.block_sight[self.i])
+    def _set_block_sight(self, block_sight):
+        self.map.block_sight[self.i] = block_sight
+        self.map.touch(self.i)
+
+    def _get_explored(self):
+        return bool(self.map.explored[self.i])
+    def _set_explored(self, explored):
+        if explored:
+            self.map.explore([self.i])
+        else:
+            self.map.explored[self.i] = 0
+            for changes in self.map.explore_watchers:
+                if not changes.everything:
+                    changes.cells.add(self.i)
+
+    def _get_type(self):
+        return self.map.type[self.i]
+    def _set_type(self, type):
+        self.map.type[self.i] = type
+        self.map.touch(self.i)
+
+    blocked = property(_get_blocked, _set_blocked)
+    block_sight = property(_get_block_sight, _set_block_sight)
+    explored = property(_get_explored, _set_explored)
+    type = property(_get_type, _set_type)
+
+
+class TileChanges:
+    #the tiles changed since a consumer (eg. the FOV map) last caught up:
+    #a set of plane indices, or everything once the whole map was refilled
+    def __init__(self):
+        self.everything = True
+        self.cells = set()
+
+    def take(self):
+        #return (everything, cells) and start collecting afresh
+        everything, cells = self.everything, self.cells
+        self.everything, self.cells = False, set()
+        return everything, cells
+
+
+#########################################################################
+###                         TileMap Class                             ###
+#########################################################################
+
+class TileMap:
+    #the tiles of a map, stored as one plane per property instead of one
+    #object per cell. Use the planes directly in hot loops, at() elsewhere.
+    #Writes must go through set_tile/carve/Tile (or call touch) so watchers
+    #and the revision counter see them, and cells get explored through explore().
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+        self.revision = 0
+        self.watchers = []
+        self.explore_watchers = []
+        self.fill(True)
+
+    def fill(self, blocked):
+        #reset every tile; by default, a blocked tile also blocks sight. Blocked tiles are
+        #DIGGABLE, except for a ring of WALL around the edge of the map.
+        size = self.w * self.h
+        self.blocked = planes.new_plane(size, int(blocked))
+        self.block_sight = planes.new_plane(size, int(blocked))
+        self.explored = planes.new_plane(size, 0)
+        self.type = planes.new_plane(size, DIGGABLE if blocked else FLOOR)
+        if blocked:
+            planes.fill(self.type, 0, self.w, WALL)
+            planes.fill(self.type, size - self.w, size, WALL)
+            for y in range(self.h):
+                self.type[y * self.w] = self.type[y * self.w + self.w - 1] = WALL
+        self.revision += 1
+        for changes in self.watchers + self.explore_watchers:
+            changes.everything = True
+            changes.cells.clear()
+
+    def watch(self):
+        #start tracking changed tiles for a new consumer
+        changes = TileChanges()
+        self.watchers.append(changes)
+        return changes
+
+    def watch_explored(self):
+        #start tracking tiles explored (or forgotten through Tile) for a new consumer
+        changes = TileChanges()
+        self.explore_watchers.append(changes)
+        return changes
+
+    def explore(self, indices):
+        #mark the tiles at a list of plane indices explored
+        explored = self.explored
+        for i in indices:
+            explored[i] = 1
+        for changes in self.explore_watchers:
+            if not changes.everything:
+                changes.cells.update(indices)
+
+    def explore_visible(self, visible):
+        #mark every tile set in a 0/1 byte plane (eg. a FOV) explored, in one step
+        #over the whole map; returns the plane indices that were not explored before
+        indices = planes.merge(self.explored, visible)
+        if indices:
+            for changes in self.explore_watchers:
+                if not changes.everything:
+                    changes.cells.update(indices)
+        return indices
+
+    def pack_explored(self):
+        #the explored plane as a bitset string, 8 tiles a byte, to save
+        return planes.pack(self.explored)
+
+    def unpack_explored(self, data):
+        #restore the explored plane from a string made by pack_explored
+        self.explored[:] = planes.unpack(data, self.w * self.h)
+        for changes in self.explore_watchers:
+            changes.everything = True
+            changes.cells.clear()
+
+    def touch(self, i):
+        #record that the tile at plane index i changed
+        self.revision += 1
+        for changes in self.watchers:
+            if not changes.everything:
+                changes.cells.add(i)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def at(self, x, y):
+        return Tile(self, y * self.w + x)
+
+    def set_tile(self, x, y, blocked, block_sight=None, type=None):
+        if block_sight is None: block_sight = blocked
+        if type is None: type = DIGGABLE if blocked else FLOOR
+        i = y * self.w + x
+        self.blocked[i] = blocked
+        self.block_sight[i] = block_sight
+        self.type[i] = type
+        self.touch(i)
+
+    def carve(self, x1, y1, x2, y2):
+        #make every tile in the rectangle [x1, x2) x [y1, y2) passable, a row at a time
+        for y in range(y1, y2):
+            start, stop = y * self.w + x1, y * self.w + x2
+            planes.fill(self.blocked, start, stop, 0)
+            planes.fill(self.block_sight, start, stop, 0)
+            planes.fill(self.type, start, stop, FLOOR)
+            for i in range(start, stop):
+                self.touch(i)
+
+    def sync_fov(self, fov_map, changes):
+        #bring a libtcod map made with map_new up to date with the tiles
+        #reported by changes, in time proportional to the change
+        everything, cells = changes.take()
+        if everything or len(cells) * 8 > self.w * self.h:
+            libtcod.map_set_properties_bulk(fov_map,
+                planes.negate(self.block_sight), planes.negate(self.blocked))
+            return
+        for i in cells:
+            libtcod.map_set_properties(fov_map, i % self.w, i / self.w,
+                not self.block_sight[i], not self.blocked[i])